@@ -1,6 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import logging
+from ..jobs import supabaseDB, terminate_active_processes
 from .routes import health, demos, tools, tool_processes, workflow_processes, workflows
+from .routes.tools import build_wrapper_index
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up the shared Supabase client and the wrapper index so the first job submission
+    does not pay connection setup or a cache walk.
+    """
+    logger = logging.getLogger(__name__)
+    app.state.wrapper_index = build_wrapper_index(app.state.wrappers_path)
+    try:
+        await supabaseDB.connect()
+    except Exception as e:
+        logger.warning(f"Supabase pre-connect failed, will connect on first use: {e}")
+    yield
+    # Leftover jobs may still write their status, so stop them while the client is open
+    await terminate_active_processes()
+    await supabaseDB.close()
 
 def create_native_fastapi_app(wrappers_path: str, workflows_dir: str) -> FastAPI:
     """
@@ -11,7 +31,8 @@ def create_native_fastapi_app(wrappers_path: str, workflows_dir: str) -> FastAPI
     app = FastAPI(
         title="Snakemake Native API",
         description="Native FastAPI endpoints for Snakemake functionality",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
 
     app.state.wrappers_path = wrappers_path
@@ -1,13 +1,38 @@
+import functools
 import logging
-import json
+import orjson
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 from fastapi import APIRouter, HTTPException, Request
 from ...schemas import DemoCall, WorkflowDemo
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Room for every wrapper and workflow in the catalog (~1,100 upstream wrappers), so
+# walking all of them does not evict entries before they are reused
+DEMO_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=DEMO_CACHE_SIZE)
+def _load_wrapper_demos(cache_file: str, mtime_ns: int) -> Tuple[DemoCall, ...]:
+    """
+    Parse the demos of a cached wrapper. mtime_ns is part of the key so a
+    re-run of 'swa parse' invalidates the entry.
+    """
+    with open(cache_file, 'rb') as f:
+        data = orjson.loads(f.read())
+    return tuple(DemoCall(**demo) for demo in data.get('demos') or [])
+
+
+@functools.lru_cache(maxsize=DEMO_CACHE_SIZE)
+def _load_workflow_demos(cache_file: str, mtime_ns: int) -> Tuple[WorkflowDemo, ...]:
+    """
+    Parse the demos of a cached workflow, keyed like _load_wrapper_demos.
+    """
+    with open(cache_file, 'rb') as f:
+        metadata = orjson.loads(f.read())
+    return tuple(WorkflowDemo(**demo) for demo in metadata.get('demos') or [])
+
 
 @router.get("/demos/wrappers/{wrapper_id:path}", response_model=List[DemoCall], operation_id="get_wrapper_demos")
 async def get_wrapper_demos(wrapper_id: str, request: Request):
@@ -32,16 +57,8 @@ async def get_wrapper_demos(wrapper_id: str, request: Request):
         )
 
     try:
-        with open(cache_file, 'r') as f:
-            data = json.load(f)
-        
-        # Extract demos from the loaded wrapper metadata
-        demos = data.get('demos', [])
-        if demos is None:
-            demos = []
-        
         # Return the demos as a list of DemoCall objects
-        return [DemoCall(**demo) for demo in demos]
+        return list(_load_wrapper_demos(str(cache_file), cache_file.stat().st_mtime_ns))
     except Exception as e:
         logger.error(f"Error loading cached demos for {wrapper_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error loading cached demos: {str(e)}")
@@ -54,8 +71,7 @@ async def get_workflow_demos(workflow_id: str, request: Request):
     """
     logger.info(f"Received request to get demos for workflow: {workflow_id}")
 
-    cache_dir = Path.home() / ".swa" / "cache" / "workflows"
-    cache_file = cache_dir / f"{workflow_id}.json"
+    cache_file = Path.home() / ".swa" / "cache" / "workflows" / f"{workflow_id}.json"
 
     if not cache_file.exists():
         raise HTTPException(
@@ -63,14 +79,7 @@ async def get_workflow_demos(workflow_id: str, request: Request):
             detail=f"Workflow metadata cache not found for: {workflow_id}. Run 'swa parse' to generate it."
         )
     try:
-        with open(cache_file, 'r') as f:
-            metadata = json.load(f)
-        
-        demos = metadata.get('demos', [])
-        if demos is None:
-            demos = []
-            
-        return [WorkflowDemo(**demo) for demo in demos]
+        return list(_load_workflow_demos(str(cache_file), cache_file.stat().st_mtime_ns))
     except Exception as e:
         logger.error(f"Error loading cached metadata for {workflow_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error loading cached metadata: {str(e)}")
@@ -1,12 +1,13 @@
+import asyncio
 import logging
+import stat
 import tempfile
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Response, status, Request
 from fastapi.responses import FileResponse
-from ...jobs import run_snakemake_job_in_background, job_store, active_processes
-from snakemake_mcp_server.db.supabase_impl import SupabaseDB
+from ...jobs import run_snakemake_job_in_background, job_store, job_store_snapshot, active_processes, supabaseDB, notify_job_finished, wait_for_job
 from ...schemas import (
     Job,
     JobList,
@@ -16,11 +17,58 @@ from ...schemas import (
     UserWrapperRequest,
 )
 import os
-from .tools import load_wrapper_metadata
+from .tools import lookup_wrapper_metadata
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-supabaseDB = SupabaseDB()
+
+class LogFileResponse(FileResponse):
+    """
+    FileResponse with larger read chunks for multi-MB logs. Starlette already answers
+    Range requests here, so pollers can fetch only the bytes appended since their last read.
+    """
+    chunk_size = 256 * 1024
+
+SNPSIFT_VARTYPE_VCF = """##fileformat=VCFv4.2
+##contig=<ID=chr1,length=248956422>
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+chr1	123	.	G	A	.	PASS	.
+"""
+
+def create_dummy_input_files(workdir: str, inputs, wrapper_id: str) -> None:
+    """
+    Create the workdir and an empty placeholder for every input path. Each parent directory is
+    created once, and files are created with a bare open/close instead of Path.touch().
+    """
+    os.makedirs(workdir, exist_ok=True)
+    if isinstance(inputs, dict):
+        names = [value for value in inputs.values() if isinstance(value, str)]
+    elif isinstance(inputs, list):
+        names = [item for item in inputs if isinstance(item, str)]
+    else:
+        return
+
+    input_paths = [Path(workdir) / name for name in names]
+    for parent in {input_path.parent for input_path in input_paths}:
+        os.makedirs(parent, exist_ok=True)
+
+    for name, input_path in zip(names, input_paths):
+        if isinstance(inputs, dict) and wrapper_id == "bio/snpsift/varType" and name == "in.vcf":
+            input_path.write_text(SNPSIFT_VARTYPE_VCF)
+            logger.debug(f"Created dummy VCF file for snpsift/varType: {input_path}")
+        else:
+            fd = os.open(input_path, os.O_CREAT | os.O_WRONLY, 0o644)
+            os.close(fd)
+            logger.debug(f"Created dummy input file: {input_path}")
+
+async def record_job_submission(job_info: dict):
+    """
+    Persist a job submission record; failures are logged so they never block the job itself.
+    """
+    try:
+        await supabaseDB.insert_record(job_info)
+    except Exception as e:
+        logger.error(f"Failed to record job submission for task {job_info.get('task_id')}: {e}")
 
 @router.post("/tool-processes", response_model=JobSubmissionResponse, status_code=status.HTTP_202_ACCEPTED, operation_id="tool_process")
 async def tool_process_endpoint(request: UserWrapperRequest, background_tasks: BackgroundTasks, response: Response, http_request: Request):
@@ -33,8 +81,7 @@ async def tool_process_endpoint(request: UserWrapperRequest, background_tasks: B
         raise HTTPException(status_code=400, detail="'wrapper_id' must be provided for tool execution.")
 
     # 1. Load WrapperMetadata to infer hidden parameters
-    wrapper_metadata_list = load_wrapper_metadata(http_request.app.state.wrappers_path)
-    wrapper_meta = next((wm for wm in wrapper_metadata_list if wm.id == request.wrapper_id), None)
+    wrapper_meta = lookup_wrapper_metadata(http_request.app, request.wrapper_id)
 
     if not wrapper_meta:
         raise HTTPException(status_code=404, detail=f"Wrapper '{request.wrapper_id}' not found.")
@@ -45,35 +92,11 @@ async def tool_process_endpoint(request: UserWrapperRequest, background_tasks: B
     # workdir = str(workdir_path)
     SHARED_ROOT = os.getenv("SHARED_ROOT")
     workdir = os.path.join(SHARED_ROOT, job_id)
-    os.makedirs(workdir, exist_ok=True)
     logger.debug(f"Generated workdir: {workdir}")
 
     # 3. Create dummy input files in the workdir based on request.inputs
     # This is necessary for Snakemake to find the input files.
-    if request.inputs:
-        if isinstance(request.inputs, dict):
-            for key, value in request.inputs.items():
-                if isinstance(value, str):
-                    input_path = Path(workdir) / value
-                    input_path.parent.mkdir(parents=True, exist_ok=True)
-                    if request.wrapper_id == "bio/snpsift/varType" and value == "in.vcf":
-                        vcf_content = """##fileformat=VCFv4.2
-##contig=<ID=chr1,length=248956422>
-#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
-chr1	123	.	G	A	.	PASS	.
-"""
-                        input_path.write_text(vcf_content)
-                        logger.debug(f"Created dummy VCF file for snpsift/varType: {input_path}")
-                    else:
-                        input_path.touch()
-                        logger.debug(f"Created dummy input file: {input_path}")
-        elif isinstance(request.inputs, list):
-            for input_item in request.inputs:
-                if isinstance(input_item, str):
-                    input_path = Path(workdir) / input_item
-                    input_path.parent.mkdir(parents=True, exist_ok=True)
-                    input_path.touch()
-                    logger.debug(f"Created dummy input file: {input_path}")
+    await asyncio.to_thread(create_dummy_input_files, workdir, request.inputs, request.wrapper_id)
 
     # 4. Infer values for hidden parameters from WrapperMetadata or use defaults
     #    Default to None if not found in metadata, as per user's instruction.
@@ -110,21 +133,15 @@ chr1	123	.	G	A	.	PASS	.
         task_id=request.task_id or job_id,
     )
 
-    job_id = str(uuid.uuid4())
     log_url = f"/tool-processes/{job_id}/log"
     job = Job(
         job_id=job_id, 
         status=JobStatus.ACCEPTED, 
         created_time=datetime.now(timezone.utc),
         log_url=log_url
-    )    
-    job = Job(job_id=job_id, status=JobStatus.ACCEPTED, created_time=datetime.now(timezone.utc))
+    )
     job_store[job_id] = job
 
-    background_tasks.add_task(run_snakemake_job_in_background, job_id, internal_request, http_request.app.state.wrappers_path)
-    
-    status_url = f"/tool-processes/{job_id}"
-    response.headers["Location"] = status_url
     job_info = {
         "user_id": request.user_id,
         "session_id": request.session_id,
@@ -132,7 +149,12 @@ chr1	123	.	G	A	.	PASS	.
         "task_id": request.task_id or job_id,
         "event": internal_request.model_dump_json()
     }
-    await supabaseDB.insert_record(job_info)
+    # Background tasks run in order, so the submission record is written before the job starts
+    background_tasks.add_task(record_job_submission, job_info)
+    background_tasks.add_task(run_snakemake_job_in_background, job_id, internal_request, http_request.app.state.wrappers_path)
+    
+    status_url = f"/tool-processes/{job_id}"
+    response.headers["Location"] = status_url
 
     return JobSubmissionResponse(job_id=job_id, status_url=status_url, log_url=log_url)
 
@@ -146,19 +168,32 @@ async def get_job_status(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
     return job
 
+@router.get("/tool-processes/{job_id}/wait", response_model=Job, operation_id="wait_tool_process")
+async def wait_tool_process(job_id: str, timeout: float = Query(30.0, ge=0, le=300, description="Maximum seconds to wait")):
+    """
+    Long-poll a Snakemake tool job: return as soon as it completes or fails, or with its
+    current status once timeout seconds have passed.
+    """
+    job = await wait_for_job(job_id, timeout)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @router.get("/tool-processes/{job_id}/log", operation_id="get_tool_process_log")
 async def get_tool_process_log(job_id: str):
     """
     Get the real-time log of a running Snakemake tool process.
     """
     log_path = Path.home() / ".swa" / "logs" / f"{job_id}.log"
-    if not log_path.exists():
+    try:
+        log_stat = await asyncio.to_thread(os.stat, log_path)
+    except FileNotFoundError:
         # Check if job exists
         if job_id not in job_store:
             raise HTTPException(status_code=404, detail="Job not found")
         return Response(content="Log file not yet created.", media_type="text/plain")
     
-    return FileResponse(log_path, media_type="text/plain")
+    return LogFileResponse(log_path, media_type="text/plain", stat_result=log_stat)
 
 @router.delete("/tool-processes/{job_id}", operation_id="cancel_tool_process")
 async def cancel_tool_process(job_id: str):
@@ -181,6 +216,7 @@ async def cancel_tool_process(job_id: str):
         # If it's in ACCEPTED but no process yet, just mark as failed
         job.status = JobStatus.FAILED
         job.result = {"status": "failed", "error_message": "Cancelled before execution started"}
+        notify_job_finished(job_id)
         return {"message": "Job cancelled before starting"}
 
 @router.get("/tool-processes/", response_model=JobList, operation_id="get_all_tool_processes")
@@ -188,59 +224,61 @@ async def get_all_jobs():
     """
     Get a list of all submitted Snakemake tool jobs.
     """
-    jobs = list(job_store.values())
+    jobs = job_store_snapshot()
     return JobList(jobs=jobs)
 
 BASE_DIR = os.environ.get("SHARED_ROOT")
-# 预处理：转为绝对路径，避免相对路径歧义
-BASE_DIR_ABS = os.path.abspath(BASE_DIR)
+# 预处理：转为规范化的绝对路径，避免相对路径和符号链接歧义
+BASE_DIR_ABS = Path(BASE_DIR).resolve()
+
+def _is_single_component(name: str) -> bool:
+    """True if name is one plain path component: no separators, not '.' or '..'."""
+    return bool(name) and name not in (".", "..") and "/" not in name and "\\" not in name and "\0" not in name
+
+def _resolve_job_file(job_id: str, file_name: str):
+    """Resolve (job_dir, file_path); resolve() touches the filesystem, so call it off the event loop."""
+    job_dir = (BASE_DIR_ABS / job_id).resolve()
+    return job_dir, (job_dir / file_name).resolve()
 
 @router.get("/download", operation_id="download")
 async def download_clipped_dem( job_id: str = Query(..., description="任务ID，如67628177-fdad-4588-9cef-2cf38506a55a"),
     file_name: str = Query(..., description="相对路径，如annotated/out.vcf")):
     """
     根据job_id和相对路径下载文件，下载文件名自动生成UUID（保留原文件后缀）
-    安全限制：禁止目录穿越（屏蔽../、./等危险路径），仅允许访问BASE_DIR下的文件
+    安全限制：禁止目录穿越（路径规范化后校验），仅允许访问BASE_DIR下该任务目录内的文件
     """
     
     try:
-        # 1. 安全校验：屏蔽../、./等危险字符（从源头杜绝路径遍历）
-        # 检查job_id是否包含危险字符
-        dangerous_chars = ["../", "..\\", "./", ".\\", "/..", "\\.."]
-        for char in dangerous_chars:
-            if char in job_id or char in file_name:
-                error_msg = f"非法参数：禁止包含 {char} 等路径遍历字符"
-                logger.error(f"Security check failed: {error_msg} | JobID: {job_id} | File: {file_name}")
-                raise HTTPException(status_code=403, detail=error_msg)
+        # 1. job_id 必须是单个路径组件，不能借助 .. 或 / 指向其他任务目录
+        if not _is_single_component(job_id):
+            error_msg = f"访问拒绝：无效的任务ID {job_id!r}"
+            logger.error(f"Path escape detected: {error_msg}")
+            raise HTTPException(status_code=403, detail=error_msg)
 
-        # 2. 拼接完整路径（job_id + file_name 直接拼接到BASE_DIR）
-        # 步骤1：拼接BASE_DIR + job_id（任务目录）
-        job_dir = os.path.join(BASE_DIR_ABS, job_id)
-        # 步骤2：拼接任务目录 + 相对文件路径
-        full_file_path = os.path.join(job_dir, file_name)
-        # 步骤3：转为绝对路径，统一校验标准
-        full_file_path_abs = os.path.abspath(full_file_path)
+        # 2. 规范化任务目录和完整路径；resolve() 会折叠 ..、. 以及符号链接
+        job_dir, full_file_path_abs = await asyncio.to_thread(_resolve_job_file, job_id, file_name)
 
-        # 3. 最终安全校验：确保拼接后的路径仍在BASE_DIR范围内
-        # 核心逻辑：绝对路径必须以BASE_DIR的绝对路径为前缀
-        if not full_file_path_abs.startswith(BASE_DIR_ABS):
-            error_msg = f"访问拒绝：仅允许下载 {BASE_DIR} 目录下的文件"
+        # 3. 安全校验：规范化后的路径必须仍在本任务目录内，且任务目录在BASE_DIR内（同时防御符号链接逃逸）
+        if not (job_dir.is_relative_to(BASE_DIR_ABS) and full_file_path_abs.is_relative_to(job_dir)):
+            error_msg = f"访问拒绝：仅允许下载任务 {job_id} 目录下的文件"
             logger.error(f"Path escape detected: {error_msg} | 请求路径: {full_file_path_abs}")
             raise HTTPException(status_code=403, detail=error_msg)
 
-        # 4. 校验文件是否存在且为普通文件
-        if not os.path.exists(full_file_path_abs):
+        # 4. 校验文件是否存在且为普通文件（单次 stat，放到线程中避免阻塞事件循环）
+        try:
+            file_stat = await asyncio.to_thread(os.stat, full_file_path_abs)
+        except FileNotFoundError:
             error_msg = f"文件不存在：{full_file_path_abs}"
             logger.error(f"Download error: {error_msg}")
             raise HTTPException(status_code=404, detail=error_msg)
         
-        if not os.path.isfile(full_file_path_abs):
+        if not stat.S_ISREG(file_stat.st_mode):
             error_msg = f"不是有效文件：{full_file_path_abs}（可能是目录）"
             logger.error(f"Download error: {error_msg}")
             raise HTTPException(status_code=400, detail=error_msg)
 
         # 5. 生成UUID下载文件名（保留原后缀）
-        file_ext = os.path.splitext(full_file_path_abs)[1]
+        file_ext = full_file_path_abs.suffix
         download_file_name = f"{uuid.uuid4()}{file_ext}"
 
         # 6. 返回文件流（强制下载）
@@ -249,7 +287,8 @@ async def download_clipped_dem( job_id: str = Query(..., description="任务ID
             path=full_file_path_abs,
             media_type="application/octet-stream",
             filename=download_file_name,
-            headers={"Content-Disposition": f"attachment; filename={download_file_name}"}
+            headers={"Content-Disposition": f"attachment; filename={download_file_name}"},
+            stat_result=file_stat
         )
     
     except HTTPException:
@@ -1,17 +1,18 @@
 import logging
 import os
-import json
+import orjson
 from pathlib import Path
-from typing import List
-from fastapi import APIRouter, HTTPException, Request
-from ...schemas import ListWrappersResponse, WrapperMetadata, WrapperMetadataResponse, WrapperInfo, UserProvidedParams
+from typing import Dict, List, Optional
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request
+from ...schemas import DemoCall, ListWrappersResponse, WrapperMetadata, WrapperMetadataResponse, WrapperWithDemosResponse, WrapperInfo, UserProvidedParams
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def load_wrapper_metadata(wrappers_dir: str) -> List[WrapperMetadata]:
+def load_wrapper_metadata(wrappers_dir: str, demos_by_id: Optional[Dict[str, list]] = None) -> List[WrapperMetadata]:
     """
-    Load metadata for all available wrappers from the pre-parsed cache.
+    Load metadata for all available wrappers from the pre-parsed cache. If demos_by_id
+    is given, it is filled with each wrapper's raw demos from the same read.
     """
     cache_dir = Path.home() / ".swa" / "cache" / "wrappers"
     if not cache_dir.exists():
@@ -23,29 +24,69 @@ def load_wrapper_metadata(wrappers_dir: str) -> List[WrapperMetadata]:
         for file in files:
             if file.endswith(".json"):
                 try:
-                    with open(os.path.join(root, file), 'r') as f:
-                        data = json.load(f)
-                        wrappers.append(WrapperMetadata(**data))
+                    with open(os.path.join(root, file), 'rb') as f:
+                        data = orjson.loads(f.read())
+                    wrapper = WrapperMetadata(**data)
+                    wrappers.append(wrapper)
+                    if demos_by_id is not None:
+                        demos_by_id[wrapper.id] = data.get('demos') or []
+                except FileNotFoundError:
+                    # Removed by a concurrent 'swa parse' between the walk and the open
+                    logger.warning(f"Cached wrapper {file} disappeared while loading; skipping it")
                 except Exception as e:
                     logger.error(f"Failed to load cached wrapper from {file}: {e}")
     return wrappers
 
+def build_wrapper_index(wrappers_dir: str) -> Dict[str, WrapperMetadata]:
+    """
+    Map wrapper id to its cached metadata for constant-time lookups.
+    """
+    return {wm.id: wm for wm in load_wrapper_metadata(wrappers_dir)}
+
+def lookup_wrapper_metadata(app: FastAPI, wrapper_id: str) -> Optional[WrapperMetadata]:
+    """
+    Find a wrapper in the index kept on app.state. The index is rebuilt on a miss so that
+    wrappers cached by 'swa parse' after startup are still found.
+    """
+    index = getattr(app.state, "wrapper_index", None)
+    if index is None or wrapper_id not in index:
+        index = app.state.wrapper_index = build_wrapper_index(app.state.wrappers_path)
+    return index.get(wrapper_id)
+
 @router.get("/tools", response_model=ListWrappersResponse, operation_id="list_tools")
-async def get_tools(request: Request):
+async def get_tools(
+    request: Request,
+    include: Optional[str] = Query(None, description="Comma-separated extras to embed per tool; 'demos' adds each tool's demo calls"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of tools to return"),
+    offset: int = Query(0, ge=0, description="Number of tools to skip"),
+):
     """
-    Get a summary of all available tools from the pre-parsed cache.
+    Get a summary of all available tools from the pre-parsed cache. With include=demos,
+    each entry also carries its demos, saving a /demos/wrappers/{id} call per tool.
+    Tools are listed in id order; limit and offset page through them, and total_count is
+    always the number of tools before paging.
     """
     logger.info("Received request to get tools from cache")
+    with_demos = "demos" in (include or "").split(",")
+    demos_by_id: Optional[Dict[str, list]] = {} if with_demos else None
 
     try:
-        wrappers = load_wrapper_metadata(request.app.state.wrappers_path)
+        wrappers = load_wrapper_metadata(request.app.state.wrappers_path, demos_by_id)
         logger.info(f"Found {len(wrappers)} tools in cache")
+        total_count = len(wrappers)
+        # Sort always, so a page is a slice of the unpaged listing; only that page is converted
+        wrappers.sort(key=lambda w: w.id)
+        wrappers = wrappers[offset:None if limit is None else offset + limit]
 
         # Create a lightweight summary and transform to response model
         response_wrappers = []
         for wrapper in wrappers:
+            extra = {}
+            if with_demos:
+                # Demos come from the same read as the metadata; only this page's are validated
+                extra["demos"] = [DemoCall(**demo) for demo in demos_by_id[wrapper.id]]
             # Create a simplified version for API response
-            simplified_wrapper = WrapperMetadataResponse(
+            simplified_wrapper = (WrapperWithDemosResponse if with_demos else WrapperMetadataResponse)(
                 id=wrapper.id,
                 info=WrapperInfo(
                     name=wrapper.info.name,
@@ -58,13 +99,14 @@ async def get_tools(request: Request):
                     inputs=wrapper.user_params.inputs,
                     outputs=wrapper.user_params.outputs,
                     params=wrapper.user_params.params
-                )
+                ),
+                **extra
             )
             response_wrappers.append(simplified_wrapper)
 
         return ListWrappersResponse(
             wrappers=response_wrappers,
-            total_count=len(response_wrappers)
+            total_count=total_count
         )
     except Exception as e:
         logger.error(f"Error getting tools from cache: {str(e)}")
@@ -87,8 +129,8 @@ async def get_tool_meta(tool_name: str, request: Request):
         )
 
     try:
-        with open(cache_file, 'r') as f:
-            data = json.load(f)
+        with open(cache_file, 'rb') as f:
+            data = orjson.loads(f.read())
         full_wrapper = WrapperMetadata(**data)
 
         # Create a simplified version for API response
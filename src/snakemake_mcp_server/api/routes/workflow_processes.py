@@ -7,11 +7,11 @@ import shutil
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Response, status, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Response, status, Request
 from fastapi.responses import FileResponse
 from ...workflow_runner import run_workflow
 from ...schemas import UserWorkflowRequest, Job, JobList, JobStatus, JobSubmissionResponse
-from ...jobs import job_store, run_and_update_job, active_processes
+from ...jobs import job_store, job_store_snapshot, run_and_update_job, active_processes, notify_job_finished, wait_for_job
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -107,6 +107,18 @@ async def get_workflow_process_status(job_id: str):
     return job
 
 
+@router.get("/workflow-processes/{job_id}/wait", response_model=Job, operation_id="wait_workflow_process")
+async def wait_workflow_process(job_id: str, timeout: float = Query(30.0, ge=0, le=300, description="Maximum seconds to wait")):
+    """
+    Long-poll a Snakemake workflow job: return as soon as it completes or fails, or with its
+    current status once timeout seconds have passed.
+    """
+    job = await wait_for_job(job_id, timeout)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @router.get("/workflow-processes/{job_id}/log", operation_id="get_workflow_process_log")
 async def get_workflow_process_log(job_id: str):
     """
@@ -143,6 +155,7 @@ async def cancel_workflow_process(job_id: str):
         # If it's in ACCEPTED but no process yet, just mark as failed
         job.status = JobStatus.FAILED
         job.result = {"status": "failed", "error_message": "Cancelled before execution started"}
+        notify_job_finished(job_id)
         return {"message": "Job cancelled before starting"}
 
 
@@ -151,6 +164,6 @@ async def get_all_workflow_processes():
     """
     Get a list of all submitted Snakemake workflow jobs.
     """
-    jobs = list(job_store.values())
+    jobs = job_store_snapshot()
     total_count = len(jobs)
     return JobList(jobs=jobs, total_count=total_count)
@@ -1,5 +1,5 @@
 import logging
-import json
+import orjson
 from pathlib import Path
 from typing import List
 from fastapi import APIRouter, HTTPException, Request
@@ -21,8 +21,8 @@ def load_workflow_metadata(workflow_id: str) -> dict:
             detail=f"Workflow metadata cache not found for: {workflow_id}. Run 'swa parse' to generate it."
         )
     try:
-        with open(cache_file, 'r') as f:
-            return json.load(f)
+        with open(cache_file, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         logger.error(f"Error loading cached metadata for {workflow_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error loading cached metadata: {str(e)}")
@@ -39,8 +39,8 @@ def get_all_cached_workflows() -> List[dict]:
     workflows = []
     for file in cache_dir.glob("*.json"):
         try:
-            with open(file, 'r') as f:
-                workflows.append(json.load(f))
+            with open(file, 'rb') as f:
+                workflows.append(orjson.loads(f.read()))
         except Exception as e:
             logger.error(f"Failed to load cached workflow from {file}: {e}")
     return workflows
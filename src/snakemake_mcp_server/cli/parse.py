@@ -1,18 +1,31 @@
 import click
 import os
-import json
+import orjson
 import yaml
 from pathlib import Path
 import shutil
 import traceback
 
-from ..snakefile_parser import generate_demo_calls_for_wrapper
+from ..snakefile_parser import (
+    demo_snakefile_for_wrapper,
+    generate_demo_calls_for_wrapper,
+    parse_snakefiles_bulk,
+    save_parse_cache,
+)
+from ..utils import YAML_SAFE_LOADER
 from ..schemas import WrapperMetadata, DemoCall, WrapperInfo, UserProvidedParams, PlatformRunParams
 
 # --- Constants ---
 CACHE_BASE_DIR = Path.home() / ".swa" / "cache"
 WRAPPER_CACHE_DIR = CACHE_BASE_DIR / "wrappers"
 WORKFLOW_CACHE_DIR = CACHE_BASE_DIR / "workflows"
+CACHE_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+
+def _write_cache_file(cache_file_path: Path, cache_data: dict) -> None:
+    """Write one metadata cache file; the API reads these back with orjson."""
+    with open(cache_file_path, 'wb') as f:
+        f.write(orjson.dumps(cache_data, option=CACHE_JSON_OPTIONS))
 
 
 # --- Helper Functions ---
@@ -27,7 +40,7 @@ def _parse_and_cache_wrapper(wrapper_path: Path, wrappers_base_path: Path):
     
     try:
         with open(meta_file_path, 'r', encoding='utf-8') as f:
-            meta_data = yaml.safe_load(f)
+            meta_data = yaml.load(f, Loader=YAML_SAFE_LOADER)
         
         notes_data = meta_data.get('notes')
         if isinstance(notes_data, str):
@@ -59,8 +72,7 @@ def _parse_and_cache_wrapper(wrapper_path: Path, wrappers_base_path: Path):
 
         cache_file_path = WRAPPER_CACHE_DIR / f"{wrapper_rel_path}.json"
         cache_file_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(cache_file_path, 'w') as f:
-            json.dump(cache_data, f, indent=2)
+        _write_cache_file(cache_file_path, cache_data)
         
         return True, num_demos
     except Exception as e:
@@ -77,14 +89,14 @@ def _parse_and_cache_workflow(workflow_path: Path, workflows_base_path: Path):
         default_config = {}
         if config_path.exists():
             with open(config_path, 'r', encoding='utf-8') as f:
-                default_config = yaml.safe_load(f) or {}
+                default_config = yaml.load(f, Loader=YAML_SAFE_LOADER) or {}
 
         # 2. Parse meta.yaml for info and param descriptions
         meta_path = workflow_path / "meta.yaml"
         info_data, params_schema = None, None
         if meta_path.exists():
             with open(meta_path, 'r', encoding='utf-8') as f:
-                meta_data = yaml.safe_load(f) or {}
+                meta_data = yaml.load(f, Loader=YAML_SAFE_LOADER) or {}
             info_data = meta_data.get("info") or {
                 "name": meta_data.get("name", workflow_id),
                 "description": meta_data.get("description"),
@@ -99,7 +111,7 @@ def _parse_and_cache_workflow(workflow_path: Path, workflows_base_path: Path):
         if demos_path.is_dir():
             for demo_file in demos_path.glob("*.yaml"):
                 with open(demo_file, 'r', encoding='utf-8') as f:
-                    demo_config = yaml.safe_load(f) or {}
+                    demo_config = yaml.load(f, Loader=YAML_SAFE_LOADER) or {}
                 demos_list.append({
                     "name": demo_file.stem,
                     "description": demo_config.get("__description__"), # Optional description key within demo file
@@ -125,8 +137,7 @@ def _parse_and_cache_workflow(workflow_path: Path, workflows_base_path: Path):
 
         cache_file_path = WORKFLOW_CACHE_DIR / f"{workflow_id}.json"
         cache_file_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(cache_file_path, 'w') as f:
-            json.dump(cache_data, f, indent=2)
+        _write_cache_file(cache_file_path, cache_data)
 
         return True, len(demos_list)
     except Exception as e:
@@ -154,17 +165,26 @@ def parse(ctx):
     
     # --- Parse Wrappers ---
     click.echo(f"\nParsing wrappers in: {wrappers_path}")
-    total_wrappers = 0
-    parsed_wrappers = 0
-    total_wrapper_demos = 0
+    wrapper_dirs = []
     for root, dirs, files in os.walk(wrappers_path):
         dirs[:] = [d for d in dirs if not d.startswith('.')]
         if "meta.yaml" in files and "wrapper.py" in files:
-            total_wrappers += 1
-            success, num_demos = _parse_and_cache_wrapper(Path(root), wrappers_path)
-            if success:
-                parsed_wrappers += 1
-                total_wrapper_demos += num_demos
+            wrapper_dirs.append(Path(root))
+
+    # Parse all test Snakefiles up front in a process pool; the per-wrapper pass below hits the cache
+    demo_snakefiles = [demo_snakefile_for_wrapper(str(wrapper_dir)) for wrapper_dir in wrapper_dirs]
+    parse_snakefiles_bulk([str(snakefile) for snakefile in demo_snakefiles if snakefile is not None])
+
+    total_wrappers = 0
+    parsed_wrappers = 0
+    total_wrapper_demos = 0
+    for wrapper_dir in wrapper_dirs:
+        total_wrappers += 1
+        success, num_demos = _parse_and_cache_wrapper(wrapper_dir, wrappers_path)
+        if success:
+            parsed_wrappers += 1
+            total_wrapper_demos += num_demos
+    save_parse_cache()
     click.echo(f"-> Parsed {parsed_wrappers}/{total_wrappers} wrappers with {total_wrapper_demos} demos.")
     
     # --- Parse Workflows ---
@@ -1,9 +1,11 @@
+import asyncio
 import click
 import logging
 import os
 import sys
 import uvicorn
 import subprocess
+import select
 import signal
 import time
 from pathlib import Path
@@ -13,6 +15,12 @@ logger = logging.getLogger(__name__)
 
 PID_FILE = Path.home() / ".swa" / "rest.pid"
 
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_LOGGING_CONFIGURED = False
+
+# Seconds running jobs get to finish after SIGTERM/SIGINT before they are terminated
+SHUTDOWN_DRAIN_TIMEOUT = 10
+
 def get_pid():
     if PID_FILE.exists():
         try:
@@ -30,6 +38,78 @@ def is_running(pid):
     except OSError:
         return False
 
+def wait_pid_exit(pid, timeout):
+    """
+    Block until the process exits or `timeout` seconds pass, returning True if it exited.
+    Uses a pidfd (Linux) or kqueue (BSD/macOS) so we wake up exactly on exit, and falls back
+    to polling elsewhere.
+    """
+    if hasattr(os, "pidfd_open"):
+        try:
+            fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            fd = None
+        if fd is not None:
+            try:
+                poller = select.poll()
+                poller.register(fd, select.POLLIN)
+                return bool(poller.poll(int(timeout * 1000)))
+            finally:
+                os.close(fd)
+    elif hasattr(select, "kqueue"):
+        kq = select.kqueue()
+        try:
+            event = select.kevent(
+                pid,
+                filter=select.KQ_FILTER_PROC,
+                flags=select.KQ_EV_ADD | select.KQ_EV_ONESHOT,
+                fflags=select.KQ_NOTE_EXIT,
+            )
+            return bool(kq.control([event], 1, timeout))
+        except ProcessLookupError:
+            return True
+        finally:
+            kq.close()
+
+    deadline = time.monotonic() + timeout
+    while is_running(pid):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+def _configure_logging_once(level):
+    """
+    Apply the requested level to the root logger, adding a stream handler only the first time
+    and only if none exists (server.py already installs one with the same format at import).
+    """
+    global _LOGGING_CONFIGURED
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _LOGGING_CONFIGURED:
+        return
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+    _LOGGING_CONFIGURED = True
+
+async def _serve(server: uvicorn.Server):
+    """
+    Run uvicorn until SIGTERM/SIGINT. uvicorn waits up to SHUTDOWN_DRAIN_TIMEOUT for in-flight
+    requests and their background jobs; the lifespan shutdown then terminates any Snakemake
+    process still running, before the Supabase client is closed.
+    """
+    loop = asyncio.get_running_loop()
+    # uvicorn restores these after serving and re-raises the captured signal; keeping it a
+    # no-op lets the process exit cleanly instead of the default handler killing it.
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, setattr, server, "should_exit", True)
+
+    await server.serve()
+
 # Common options for reuse
 def common_rest_options(f):
     options = [
@@ -87,11 +167,7 @@ def run(ctx, host, port, log_level, workflow_profile, prefill):
     host, port, log_level, workflow_profile, prefill = merge_params(ctx, host, port, log_level, workflow_profile, prefill)
 
     # Reconfigure logging to respect the user's choice
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        force=True
-    )
+    _configure_logging_once(log_level)
     
     wrappers_path = ctx.obj['WRAPPERS_PATH']
     workflows_dir = ctx.obj['WORKFLOWS_DIR']
@@ -115,7 +191,15 @@ def run(ctx, host, port, log_level, workflow_profile, prefill):
     app.state.workflow_profile = workflow_profile
     app.state.prefill = prefill
     
-    uvicorn.run(app, host=host, port=port, log_level=log_level.lower())
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        log_level=log_level.lower(),
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_TIMEOUT,
+    )
+    # Use the loop uvicorn would pick itself (uvloop when installed)
+    asyncio.run(_serve(uvicorn.Server(config)), loop_factory=config.get_loop_factory())
 
 @rest.command(help="Start the server in the background.")
 @common_rest_options
@@ -149,21 +233,33 @@ def start(ctx, host, port, log_level, workflow_profile, prefill):
     
     cmd.append("run")
     
-    with open(server_log, "a") as f:
-        process = subprocess.Popen(
-            cmd,
-            stdout=f,
-            stderr=f,
-            preexec_fn=os.setpgrp if os.name != 'nt' else None
-        )
+    if hasattr(os, "posix_spawn"):
+        # posix_spawn avoids fork()'s copy of this process; the log fd becomes stdout/stderr
+        log_fd = os.open(server_log, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            pid = os.posix_spawn(
+                sys.executable,
+                cmd,
+                os.environ,
+                file_actions=[
+                    (os.POSIX_SPAWN_DUP2, log_fd, 1),
+                    (os.POSIX_SPAWN_DUP2, log_fd, 2),
+                    (os.POSIX_SPAWN_CLOSE, log_fd),
+                ],
+                setpgroup=0,
+            )
+        finally:
+            os.close(log_fd)
+    else:
+        with open(server_log, "a") as f:
+            pid = subprocess.Popen(cmd, stdout=f, stderr=f).pid
     
     PID_FILE.parent.mkdir(parents=True, exist_ok=True)
-    PID_FILE.write_text(str(process.pid))
+    PID_FILE.write_text(str(pid))
     
-    # Give it a second to start and check
-    time.sleep(2)
-    if is_running(process.pid):
-        click.echo(f"Server started (PID: {process.pid}).")
+    # Give it a moment to start; an early exit means startup failed
+    if not wait_pid_exit(pid, 2.0):
+        click.echo(f"Server started (PID: {pid}).")
         click.echo(f"Logs: {server_log}")
     else:
         click.echo("Server failed to start. Check logs.")
@@ -181,13 +277,9 @@ def stop():
     try:
         os.kill(pid, signal.SIGTERM)
         # Wait a bit for it to stop
-        for _ in range(5):
-            if not is_running(pid):
-                break
-            time.sleep(1)
-        
-        if is_running(pid):
+        if not wait_pid_exit(pid, SHUTDOWN_DRAIN_TIMEOUT + 5.0):
             os.kill(pid, signal.SIGKILL)
+            wait_pid_exit(pid, 2.0)
             
         click.echo("Server stopped.")
     except OSError as e:
@@ -1,24 +1,77 @@
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
-from supabase import create_client, Client
+from typing import Dict, List, Optional, Any, Tuple
 import os
 import asyncio
-import requests
+import contextlib
+import logging
+import random
+import httpx
+import orjson
 
 from snakemake_mcp_server.schemas import JobStatus
 
-# 1. 配置 HTTP 客户端（包含 timeout/verify）
-http_client = requests.Session()
-# 设置超时时间（替代原 timeout 参数）
-http_client.timeout = 30  # 单位：秒
-# 设置 SSL 验证（替代原 verify 参数）
-http_client.verify = True  # 或指定证书路径："/path/to/cert.pem"
+logger = logging.getLogger(__name__)
+
+# REST batch inserts are split into chunks of this many rows, sent with bounded concurrency
+BATCH_CHUNK = 500
+MAX_CONCURRENCY = 4
+
+# Terminal status updates are buffered and written in one request per status, this long
+# after the first one arrives, or as soon as this many are pending
+STATUS_FLUSH_INTERVAL = 0.1
+STATUS_FLUSH_MAX = 100
+# After a flush with transient failures the delay doubles up to this cap; a task's status
+# is dropped once this many flushes in a row have failed to write it
+STATUS_FLUSH_BACKOFF_CAP = 30.0
+STATUS_FLUSH_MAX_ATTEMPTS = 5
+TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED)
+
+# Keep-alive pool shared by all PostgREST calls
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+
+def _is_retryable(error: Exception) -> bool:
+    """Network failures and 5xx responses are transient; 4xx responses are not."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return False
+
+async def _with_retry(coro_factory, *, retries: int = 3, base: float = 0.05, cap: float = 1.0):
+    """
+    Await coro_factory(), retrying transient errors with capped exponential backoff plus jitter.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await coro_factory()
+        except Exception as e:
+            if attempt == retries or not _is_retryable(e):
+                raise
+            await asyncio.sleep(min(cap, base * 2 ** attempt) + random.random() * base)
+
+def _in_filter(values) -> str:
+    """Build a PostgREST in.(...) filter, quoting values so commas and quotes survive."""
+    quoted = ",".join(
+        '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values
+    )
+    return f"in.({quoted})"
 
 class SupabaseDB():
+    """
+    Minimal async client for the Supabase PostgREST endpoint, talking HTTP/2 over one
+    persistent httpx.AsyncClient instead of the blocking supabase-py wrapper.
+    """
+
     def __init__(self):
-        self.supabase: Optional[Client] = None
+        self._http: Optional[httpx.AsyncClient] = None
         self.table_name: Optional[str] = None
         self._lock = asyncio.Lock()
+        self._last_status: Dict[str, JobStatus] = {}
+        self._status_buffer: Dict[str, JobStatus] = {}
+        self._status_pending = asyncio.Event()
+        self._status_attempts: Dict[str, int] = {}
+        self._flush_delay = STATUS_FLUSH_INTERVAL
+        self._status_flusher: Optional[asyncio.Task] = None
 
     async def connect(self) -> None:
         """从环境变量初始化Supabase连接"""
@@ -31,113 +84,254 @@ class SupabaseDB():
 
         self.table_name = os.environ.get("SUPABASE_TABLE_NAME", "sciagi_mcp_snakemake_logger")
         async with self._lock:
-            if self.supabase is None:
-                self.supabase = create_client(supabase_url, supabase_key)
+            if self._http is None:
+                self._http = httpx.AsyncClient(
+                    base_url=f"{supabase_url.rstrip('/')}/rest/v1/",
+                    headers={
+                        "apikey": supabase_key,
+                        "Authorization": f"Bearer {supabase_key}",
+                        "Prefer": "return=representation",
+                    },
+                    # Connection failures are retried by the transport; the request was never sent
+                    transport=httpx.AsyncHTTPTransport(http2=True, limits=HTTP_LIMITS, retries=3),
+                    timeout=30,
+                )
+            if self._status_flusher is None or self._status_flusher.done():
+                self._status_flusher = asyncio.create_task(self._flush_status_when_pending())
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        """Send one PostgREST request and return the decoded JSON body."""
+        content = None
+        if json_body is not None:
+            # orjson handles datetimes natively and is much faster than httpx's stdlib json
+            content = orjson.dumps(json_body, option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY)
+            headers = {"Content-Type": "application/json", **(headers or {})}
+        response = await self._http.request(method, path, params=params, content=content, headers=headers)
+        response.raise_for_status()
+        return orjson.loads(response.content) if response.content else []
+
+    async def _request_with_retry(self, method: str, params: Optional[Dict[str, Any]] = None, json_body: Any = None) -> Any:
+        return await _with_retry(
+            lambda: self._request(method, self.table_name, params=params, json_body=json_body)
+        )
+
+    async def _insert(self, rows: Any) -> Any:
+        """
+        Insert one row or a list of rows. Rows that carry their primary key are sent as
+        merge-duplicates upserts, which makes them safe to retry; plain inserts are sent once
+        so a 5xx after the server committed cannot produce a duplicate row.
+        """
+        batch = rows if isinstance(rows, list) else [rows]
+        if batch and all("id" in row for row in batch):
+            headers = {"Prefer": "resolution=merge-duplicates,return=representation"}
+            return await _with_retry(
+                lambda: self._request("POST", self.table_name, json_body=rows, headers=headers)
+            )
+        return await self._request("POST", self.table_name, json_body=rows)
 
     async def insert_record(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        if not self.supabase:
+        if self._http is None:
             await self.connect()  # 自动重连
 
-        try:
-            async with self._lock:
-                response = self.supabase.table(self.table_name).insert(data).execute()
-            return response.data[0] if response.data else None
-        except Exception as e:
-            # 重试一次
-            await asyncio.sleep(0.5)
-            async with self._lock:
-                response = self.supabase.table(self.table_name).insert(data).execute()
-            return response.data[0] if response.data else None
+        rows = await self._insert(data)
+        return rows[0] if rows else None
 
     async def batch_insert(
         self, data_list: List[Dict[str, Any]]
     ) -> Optional[List[Dict[str, Any]]]:
-        if not self.supabase:
+        if self._http is None:
             await self.connect()  # 自动重连
-        if not self.supabase or not self.table_name:
+        if self._http is None or not self.table_name:
             raise RuntimeError("Supabase client not initialized")
-        
-        try:
-            response = self.supabase.table(self.table_name).insert(data_list).execute()
-            return response.data
-        except Exception as e:
-            # 重试一次
-            await asyncio.sleep(0.5)
-            response = self.supabase.table(self.table_name).insert(data_list).execute()
-            return response.data
+
+        if len(data_list) <= BATCH_CHUNK:
+            return await self._insert(data_list)
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        async def _insert_chunk(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self._insert(chunk)
+
+        chunks = [data_list[i:i + BATCH_CHUNK] for i in range(0, len(data_list), BATCH_CHUNK)]
+        results = await asyncio.gather(*map(_insert_chunk, chunks))
+        return [row for rows in results for row in rows]
 
     async def query_records(self, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
-        if not self.supabase or not self.table_name:
+        if self._http is None or not self.table_name:
             raise RuntimeError("Supabase client not initialized")
 
-        query = self.supabase.from_(self.table_name)
+        params = {"select": "*"}
         for key, value in filters.items():
-            query = query.select("*").eq(key, value)
+            if isinstance(value, (list, tuple, set)):
+                # One in.(...) filter instead of a query per value
+                params[key] = _in_filter(value)
+            else:
+                params[key] = f"eq.{value}"
 
-        response = query.execute()
-        return response.data
+        return await self._request("GET", self.table_name, params=params)
     
     async def check_connection(self) -> bool:
-        result = self.supabase.from_("workflows").select("*").limit(1).execute()
+        result = await self._request("GET", "workflows", params={"select": "*", "limit": 1})
         print(result)
         return result
 
     async def update_record_by_id(
         self, id: str, data: Dict[str, Any]
     ) -> Optional[Dict[str, Any]]:
-        if not self.supabase:
+        if self._http is None:
             await self.connect()  # 自动重连
 
-        try:
-            async with self._lock:
-                response = (
-                    self.supabase.from_(self.table_name)
-                    .update(data)
-                    .eq("id", id)
-                    .execute()
-                )
-            return response.data[0] if response.data else None
-        except Exception as e:
-            # 重试一次
-            await asyncio.sleep(0.5)
-            async with self._lock:
-                response = (
-                    self.supabase.from_(self.table_name)
-                    .update(data)
-                    .eq("id", id)
-                    .execute()
-                )
-            return response.data[0] if response.data else None
+        rows = await self._request_with_retry("PATCH", params={"id": f"eq.{id}"}, json_body=data)
+        return rows[0] if rows else None
+
     async def update_task_status_by_task_id(
         self, task_id: str, status: JobStatus
     ) -> Optional[Dict[str, Any]]:
-        if not self.supabase:
+        """
+        Persist a task status change. Repeats of the last persisted status are skipped, and
+        terminal statuses are buffered so bursts of completions share one request.
+        """
+        if self._last_status.get(task_id) == status:
+            return None
+        if self._http is None:
             await self.connect()  # 自动重连
+
+        if status in TERMINAL_STATUSES:
+            self._last_status[task_id] = status
+            self._status_buffer[task_id] = status
+            self._status_pending.set()
+            # While backing off after failed flushes, leave the timing to the flusher
+            if len(self._status_buffer) >= STATUS_FLUSH_MAX and self._flush_delay <= STATUS_FLUSH_INTERVAL:
+                await self.flush_status_buffer()
+            return None
+
         data = {
             "updated_at" : datetime.now(timezone.utc).isoformat(),
             "status" : status.value
         }
-        try:
-            async with self._lock:
-                response = (
-                    self.supabase.from_(self.table_name)
-                    .update(data)
-                    .eq("task_id", task_id)
-                    .execute()
-                )
-            return response.data[0] if response.data else None
-        except Exception as e:
-            # 重试一次
-            await asyncio.sleep(0.5)
-            async with self._lock:
-                response = (
-                    self.supabase.from_(self.table_name)
-                    .update(data)
-                    .eq("task_id", task_id)
-                    .execute()
+        rows = await self._request_with_retry("PATCH", params={"task_id": f"eq.{task_id}"}, json_body=data)
+        # Only a written status counts as a repeat; a failed write must stay retryable
+        self._last_status[task_id] = status
+        return rows[0] if rows else None
+
+    def forget_task(self, task_id: str) -> None:
+        """Drop per-task dedup state once the job has left the in-memory job store."""
+        self._last_status.pop(task_id, None)
+        self._status_attempts.pop(task_id, None)
+
+    async def update_statuses_bulk(
+        self, items: List[Tuple[str, JobStatus]]
+    ) -> Dict[JobStatus, Optional[Exception]]:
+        """
+        Persist many (task_id, status) pairs with one PATCH per distinct status, sent
+        concurrently. Returns the outcome per status: None on success, else the error.
+        """
+        if self._http is None:
+            await self.connect()  # 自动重连
+
+        by_status: Dict[JobStatus, List[str]] = {}
+        for task_id, status in items:
+            by_status.setdefault(status, []).append(task_id)
+
+        updated_at = datetime.now(timezone.utc).isoformat()
+        statuses = list(by_status)
+        results = await asyncio.gather(
+            *(
+                self._request_with_retry(
+                    "PATCH",
+                    params={"task_id": _in_filter(by_status[status])},
+                    json_body={"updated_at": updated_at, "status": status.value},
                 )
-            return response.data[0] if response.data else None
+                for status in statuses
+            ),
+            return_exceptions=True,
+        )
+        return {
+            status: result if isinstance(result, Exception) else None
+            for status, result in zip(statuses, results)
+        }
+
+    async def flush_status_buffer(self) -> None:
+        """
+        Write buffered terminal statuses through update_statuses_bulk. Transiently failed
+        entries are requeued and the flusher backs off; an entry is dropped with one log
+        line after STATUS_FLUSH_MAX_ATTEMPTS failed flushes.
+        """
+        if not self._status_buffer:
+            return
+        pending, self._status_buffer = self._status_buffer, {}
+
+        try:
+            outcomes = await self.update_statuses_bulk(list(pending.items()))
+        except asyncio.CancelledError:
+            # Cancelled mid-write (e.g. by close()): put the batch back so it is not lost
+            for task_id, status in pending.items():
+                self._status_buffer.setdefault(task_id, status)
+            raise
+        dropped = []
+        for task_id, status in pending.items():
+            error = outcomes[status]
+            if error is not None and _is_retryable(error):
+                attempts = self._status_attempts.get(task_id, 0) + 1
+                if attempts < STATUS_FLUSH_MAX_ATTEMPTS:
+                    # Transient failure: try again on a later flush
+                    self._status_attempts[task_id] = attempts
+                    self._status_buffer.setdefault(task_id, status)
+                    continue
+                dropped.append(task_id)
+            self._status_attempts.pop(task_id, None)
+            if self._last_status.get(task_id) == status:
+                # Terminal tasks get no further updates, so stop tracking them
+                del self._last_status[task_id]
+
+        failed = {status: error for status, error in outcomes.items() if error is not None}
+        for status, error in failed.items():
+            if not _is_retryable(error):
+                logger.error(f"Failed to persist status {status.value}: {error}")
+        if dropped:
+            logger.error(
+                f"Dropping {len(dropped)} status updates after {STATUS_FLUSH_MAX_ATTEMPTS} failed flushes: "
+                f"{', '.join(dropped)}"
+            )
+        if any(_is_retryable(error) for error in failed.values()):
+            self._flush_delay = min(self._flush_delay * 2, STATUS_FLUSH_BACKOFF_CAP)
+            logger.warning(
+                f"Status flush failed ({'; '.join(str(e) for e in failed.values())}); "
+                f"{len(self._status_buffer)} pending, next attempt in {self._flush_delay:.1f}s"
+            )
+        else:
+            self._flush_delay = STATUS_FLUSH_INTERVAL
+        if self._status_buffer:
+            self._status_pending.set()
+
+    async def _flush_status_when_pending(self) -> None:
+        """
+        Sleep until a terminal status is buffered, let the burst collect, then flush it.
+        After failed flushes the wait grows (see flush_status_buffer).
+        """
+        while True:
+            await self._status_pending.wait()
+            await asyncio.sleep(self._flush_delay)
+            self._status_pending.clear()
+            await self.flush_status_buffer()
         
     async def close(self) -> None:
-        """Supabase客户端无需显式关闭连接"""
-        pass
+        """刷新缓冲的状态更新，并关闭共享的 HTTP 连接池"""
+        if self._status_flusher is not None:
+            # Wait for the flusher to stop; a batch it was writing is put back in the buffer
+            self._status_flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._status_flusher
+            self._status_flusher = None
+        if self._http is not None:
+            await self.flush_status_buffer()
+            await self._http.aclose()
+            self._http = None
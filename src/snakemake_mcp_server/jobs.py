@@ -1,26 +1,159 @@
 import logging
 import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 
 from snakemake_mcp_server.db.supabase_impl import SupabaseDB
 from .wrapper_runner_k8s import run_wrapper_in_k8s
 
 from .wrapper_runner import run_wrapper
-from .schemas import JobStatus, InternalWrapperRequest
-from typing import Callable, Coroutine, Dict, Any, Optional
+from .schemas import Job, JobStatus, InternalWrapperRequest
+from typing import Callable, Coroutine, Dict, Any, List, Optional, Tuple
 from datetime import datetime, timezone
 
-# In-memory store for jobs
-job_store = {}
+
+class JobStore:
+    """
+    In-memory job registry. All access goes through a re-entrant lock, so listing jobs
+    never races with concurrent submissions.
+
+    The store is bounded: jobs that finished more than `ttl` seconds ago, and the earliest
+    finished jobs beyond `maxsize`, are evicted on insert. Accepted or running jobs are never
+    evicted, since their runners still update them. Supabase remains the durable record.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400, on_evict: Optional[Callable[[str], None]] = None):
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # Finished jobs only, in the order they finished, so eviction candidates come first
+        self._finished_at: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        excess = len(self._jobs) - self.maxsize
+        victims = []
+        for job_id, finished_at in self._finished_at.items():
+            expired = now - finished_at > self.ttl
+            if not expired and len(victims) >= excess:
+                break
+            victims.append(job_id)
+        for job_id in victims:
+            del self._jobs[job_id]
+            del self._finished_at[job_id]
+            if self.on_evict is not None:
+                self.on_evict(job_id)
+
+    def mark_finished(self, job_id: str) -> None:
+        """Start the job's TTL; call once it reaches a final status."""
+        with self._lock:
+            if job_id in self._jobs:
+                self._finished_at[job_id] = time.monotonic()
+                self._finished_at.move_to_end(job_id)
+
+    def __getitem__(self, job_id: str) -> Job:
+        with self._lock:
+            return self._jobs[job_id]
+
+    def __setitem__(self, job_id: str, job: Job) -> None:
+        with self._lock:
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            self._finished_at.pop(job_id, None)
+            if job.status not in (JobStatus.ACCEPTED, JobStatus.RUNNING):
+                self._finished_at[job_id] = time.monotonic()
+            self._evict()
+
+    def __delitem__(self, job_id: str) -> None:
+        with self._lock:
+            del self._jobs[job_id]
+            self._finished_at.pop(job_id, None)
+            if self.on_evict is not None:
+                self.on_evict(job_id)
+
+    def __contains__(self, job_id: object) -> bool:
+        with self._lock:
+            return job_id in self._jobs
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def get(self, job_id: str, default: Optional[Job] = None) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id, default)
+
+    def snapshot(self) -> Tuple[Job, ...]:
+        """Return the current jobs, in submission order, as an immutable tuple."""
+        with self._lock:
+            return tuple(self._jobs.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._jobs.clear()
+            self._finished_at.clear()
+
 
 supabaseDB = SupabaseDB()
 
+# In-memory store for jobs; Supabase forgets a task's dedup state when its job leaves
+job_store = JobStore(
+    maxsize=int(os.environ.get("JOB_STORE_MAX", 10000)),
+    ttl=float(os.environ.get("JOB_STORE_TTL", 86400)),
+    on_evict=supabaseDB.forget_task,
+)
+
+
+def job_store_snapshot() -> Tuple[Job, ...]:
+    """Cheap point-in-time read of all jobs for list endpoints."""
+    return job_store.snapshot()
+
+# Execution backend, fixed at import (the CLI loads ~/.swa/.env before importing this module)
+RUN_MODE = os.environ.get("RUN_MODE")
+
 # In-memory store for active subprocesses
 active_processes: Dict[str, asyncio.subprocess.Process] = {}
 
+# Events that long-poll waiters block on, created on first wait and set once the job finishes
+_job_finished_events: Dict[str, asyncio.Event] = {}
+
 logger = logging.getLogger(__name__)
 
+
+def notify_job_finished(job_id: str) -> None:
+    """
+    Start the job's TTL in the store and wake everyone waiting in wait_for_job; call after a
+    job reaches a final status.
+    """
+    job_store.mark_finished(job_id)
+    event = _job_finished_events.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+
+async def wait_for_job(job_id: str, timeout: float) -> Optional[Job]:
+    """
+    Wait up to timeout seconds for a job to leave the accepted/running states and
+    return it as it stands then, or None if the job is unknown.
+    """
+    job = job_store.get(job_id)
+    if job is None or job.status not in (JobStatus.ACCEPTED, JobStatus.RUNNING):
+        return job
+    event = _job_finished_events.get(job_id)
+    if event is None:
+        event = _job_finished_events[job_id] = asyncio.Event()
+    try:
+        async with asyncio.timeout(timeout):
+            await event.wait()
+    except TimeoutError:
+        pass
+    return job_store.get(job_id)
+
 async def run_and_update_job(job_id: str, task: Callable[[], Coroutine[Any, Any, Dict]]):
     """
     Generic function to run a task in the background and update the job store.
@@ -61,6 +194,43 @@ async def run_and_update_job(job_id: str, task: Callable[[], Coroutine[Any, Any,
         # Always remove from active_processes when finished
         if job_id in active_processes:
             del active_processes[job_id]
+        notify_job_finished(job_id)
+
+
+async def terminate_active_processes(timeout: float = 5) -> None:
+    """
+    Terminate Snakemake processes still running at shutdown and wait up to `timeout`
+    seconds for them, so they do not outlive the server.
+    """
+    processes = [process for process in active_processes.values() if process.returncode is None]
+    if not processes:
+        return
+    logger.info(f"Terminating {len(processes)} Snakemake process(es) still running at shutdown")
+    for process in processes:
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            pass
+    _, pending = await asyncio.wait([asyncio.create_task(process.wait()) for process in processes], timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+
+def _collect_output_paths(outputs, workdir: str) -> List[str]:
+    """
+    Resolve the requested outputs (a list of names, or a dict whose values are names or
+    {'path': ..., 'is_directory': True} entries) to absolute paths under workdir.
+    """
+    base = Path(workdir)
+    if isinstance(outputs, list):
+        return [str(base / name) for name in outputs]
+    if isinstance(outputs, dict):
+        names = [
+            value.get('path') if isinstance(value, dict) and value.get('is_directory') else value
+            for value in outputs.values()
+        ]
+        return [str(base / name) for name in names]
+    return []
 
 
 async def run_snakemake_job_in_background(job_id: str, request: InternalWrapperRequest, wrappers_path: str):
@@ -71,8 +241,7 @@ async def run_snakemake_job_in_background(job_id: str, request: InternalWrapperR
 
     # The actual task is to run the wrapper
     async def task():
-        run_mode = os.environ.get("RUN_MODE")
-        if run_mode == "k8s":            
+        if RUN_MODE == "k8s":
             result = await run_wrapper_in_k8s(request=request)
         else:
             result = await run_wrapper(request=request, job_id=job_id)
@@ -80,17 +249,7 @@ async def run_snakemake_job_in_background(job_id: str, request: InternalWrapperR
         # Post-process to add output file paths to result
         output_file_paths = []
         if request.outputs and request.workdir:
-            workdir_path = Path(request.workdir)
-            if isinstance(request.outputs, list):
-                for output_name in request.outputs:
-                    output_file_paths.append(str(workdir_path / output_name))
-            elif isinstance(request.outputs, dict):
-                for output_name in request.outputs.values():
-                    # Handle directory outputs
-                    if isinstance(output_name, dict) and output_name.get('is_directory'):
-                         output_file_paths.append(str(workdir_path / output_name.get('path')))
-                    else:
-                        output_file_paths.append(str(workdir_path / output_name))
+            output_file_paths = _collect_output_paths(request.outputs, request.workdir)
 
         final_result = result.copy()
         final_result["output_files"] = output_file_paths
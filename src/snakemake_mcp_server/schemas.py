@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, SerializeAsAny
 from typing import Union, Dict, List, Optional, Any
 from datetime import datetime
 from enum import Enum
@@ -121,8 +121,13 @@ class DemoCaseResponse(BaseModel):
     curl_example: str
 
 
+class WrapperWithDemosResponse(WrapperMetadataResponse):
+    demos: List[DemoCall] = []
+
+
 class ListWrappersResponse(BaseModel):
-    wrappers: List[WrapperMetadataResponse]
+    # SerializeAsAny keeps the demos of WrapperWithDemosResponse entries (GET /tools?include=demos)
+    wrappers: List[SerializeAsAny[WrapperMetadataResponse]]
     total_count: int
 
 
@@ -3,10 +3,14 @@ Utility to convert Snakemake wrapper test Snakefiles to tool/process API calls.
 Parses Snakefile content using the official Snakemake API and its DAG.
 """
 import os
+import copy
+import hashlib
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, List, Any, Tuple, Set
+from typing import Dict, List, Any, Optional, Tuple, Set
 import sys
-import tempfile
 import logging
 # from snakemake.io import Params # Explicitly import Params - REMOVED to avoid NameError
 
@@ -14,12 +18,65 @@ logger = logging.getLogger(__name__)
 
 # logger.debug(f"ID of imported Params class: {id(Params)}") # REMOVED
 
+# Parsed Snakefiles keyed by path and content. Kept outside ~/.swa/cache, which 'swa parse' clears.
+PARSE_CACHE_FILE = Path.home() / ".swa" / "parser_cache.pkl"
+# Bump when the shape of parse results or cache keys changes so stale entries are ignored
+_PARSE_CACHE_VERSION = 3
+_parse_cache: Optional[Dict[str, Tuple[List[Dict[str, Any]], Set[str]]]] = None
+# Keys looked up in this process; only these are persisted, which prunes stale entries
+_used_cache_keys: Set[str] = set()
+
+def _identity(val: Any) -> Any:
+    return val
+
+
+def _serialize_sequence(val: Any) -> List[Any]:
+    return [_value_serializer(v) for v in val]
+
+
+def _serialize_dict(val: Dict[Any, Any]) -> Dict[str, Any]:
+    # The same param/resource keys recur across every rule; share one string per key
+    return {sys.intern(str(k)): _value_serializer(v) for k, v in val.items()}
+
+
+# Exact-type fast path for plain values; Snakemake's Namedlist/IOFile subclasses fall
+# through to the probing in _value_serializer
+_SERIALIZERS = {
+    str: _identity,
+    int: _identity,
+    float: _identity,
+    bool: _identity,
+    type(None): _identity,
+    list: _serialize_sequence,
+    tuple: _serialize_sequence,
+    set: _serialize_sequence,
+    dict: _serialize_dict,
+}
+
+_PARAMS_TYPE: Any = None
+
+
+def _params_type() -> Any:
+    global _PARAMS_TYPE
+    if _PARAMS_TYPE is None:
+        try:
+            from snakemake.io import Params
+            _PARAMS_TYPE = Params
+        except ImportError:
+            _PARAMS_TYPE = ()  # isinstance(val, ()) is always False
+    return _PARAMS_TYPE
+
+
 def _value_serializer(val: Any) -> Any:
     """
     Serialize complex Snakemake objects to basic Python types.
     """
+    serializer = _SERIALIZERS.get(type(val))
+    if serializer is not None:
+        return serializer(val)
+
     # 1. Handle Params, which is a special Namedlist that must be treated as a dict.
-    if type(val).__name__ == 'Params':
+    if isinstance(val, _params_type()):
         if hasattr(val, '_get_names'):
             params_dict = {}
             for name, (index, _) in list(val._get_names()):
@@ -61,7 +118,7 @@ def _value_serializer(val: Any) -> Any:
         return val
     if isinstance(val, dict) or hasattr(val, 'items'):
         try:
-            return {str(k): _value_serializer(v) for k, v in val.items()}
+            return _serialize_dict(val)
         except:
             return str(val)
             
@@ -79,11 +136,85 @@ def _value_serializer(val: Any) -> Any:
     return str(val)
 
 
+def _dir_fingerprint(directory: str) -> bytes:
+    """
+    Names, sizes and mtimes of every file under the Snakefile's directory, so included
+    rule files, configfiles and test inputs invalidate the cached parse when they change.
+    """
+    entries = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append(f"{os.path.relpath(path, directory)}\0{st.st_size}\0{st.st_mtime_ns}")
+    entries.sort()
+    return "\n".join(entries).encode()
+
+
+def _parse_cache_key(snakefile_path: str, content: bytes) -> str:
+    try:
+        from snakemake import __version__ as snakemake_version
+    except ImportError:
+        snakemake_version = "unknown"
+    resolved = os.path.realpath(snakefile_path)
+    digest = hashlib.blake2b(content, digest_size=16)
+    digest.update(_dir_fingerprint(os.path.dirname(resolved)))
+    return f"{_PARSE_CACHE_VERSION}:{snakemake_version}:{resolved}:{digest.hexdigest()}"
+
+
+def _get_parse_cache() -> Dict[str, Tuple[List[Dict[str, Any]], Set[str]]]:
+    global _parse_cache
+    if _parse_cache is None:
+        _parse_cache = {}
+        if PARSE_CACHE_FILE.exists():
+            try:
+                with open(PARSE_CACHE_FILE, 'rb') as f:
+                    _parse_cache = pickle.load(f)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable parse cache {PARSE_CACHE_FILE}: {e}")
+    return _parse_cache
+
+
+def save_parse_cache() -> None:
+    """
+    Persist the in-memory parse cache so later runs can skip unchanged Snakefiles.
+    """
+    # Empty results may be parse failures; only persist real parses. Entries not looked up
+    # in this run belong to Snakefiles that changed or no longer exist, so they are dropped.
+    entries = {
+        key: value for key, value in (_parse_cache or {}).items()
+        if value[0] and key in _used_cache_keys
+    }
+    if not entries:
+        return
+    PARSE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = PARSE_CACHE_FILE.with_suffix(".tmp")
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, PARSE_CACHE_FILE)
+
+
+# A Snakefile without any of these defines no rules, directly or through another file
+_RULE_KEYWORDS = (b"rule", b"checkpoint", b"include", b"module")
+
+
+def _may_define_rules(content: bytes) -> bool:
+    return any(keyword in content for keyword in _RULE_KEYWORDS)
+
+
 def parse_snakefile_with_api(snakefile_path: str) -> Tuple[List[Dict[str, Any]], Set[str]]:
     """
     Parse a Snakefile using the Snakemake API to extract rule information
     and identify leaf rules from the DAG.
 
+    Results are cached by the Snakefile's resolved path, its content hash, the sizes and
+    mtimes of the files beside it and the Snakemake version, so an unchanged Snakefile is
+    only run through the API once. Rules that cannot be demos
+    (no wrapper directive, or not a leaf of a multi-rule DAG) carry only name and wrapper.
+
     Args:
         snakefile_path: Path to the Snakefile.
 
@@ -95,6 +226,115 @@ def parse_snakefile_with_api(snakefile_path: str) -> Tuple[List[Dict[str, Any]],
     if not os.path.exists(snakefile_path):
         return [], set()
 
+    with open(snakefile_path, 'rb') as f:
+        content = f.read()
+    if not _may_define_rules(content):
+        return [], set()
+    cache_key = _parse_cache_key(snakefile_path, content)
+    _used_cache_keys.add(cache_key)
+    cache = _get_parse_cache()
+    if cache_key in cache:
+        return copy.deepcopy(cache[cache_key])
+
+    parsed_rules, leaf_rule_names = _parse_snakefile_uncached(snakefile_path)
+    cache[cache_key] = copy.deepcopy((parsed_rules, leaf_rule_names))
+    return parsed_rules, leaf_rule_names
+
+
+def _init_parse_worker() -> None:
+    # Pay the Snakemake API import once per worker rather than once per Snakefile
+    try:
+        import snakemake.api  # noqa: F401
+    except ImportError:
+        pass
+
+
+def parse_snakefiles_bulk(
+    snakefile_paths: List[str], max_workers: Optional[int] = None
+) -> Dict[str, Tuple[List[Dict[str, Any]], Set[str]]]:
+    """
+    Parse many Snakefiles in a pool of long-lived worker processes and return the
+    results by path. Cached and repeated Snakefiles are not re-parsed, and every
+    result is added to the parse cache, so later parse_snakefile_with_api calls hit it.
+    Processes rather than threads are required because parsing changes the working directory.
+    """
+    cache = _get_parse_cache()
+    keys_by_path: Dict[str, str] = {}
+    to_parse: Dict[str, str] = {}
+    for path in snakefile_paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            content = f.read()
+        if not _may_define_rules(content):
+            continue
+        key = _parse_cache_key(path, content)
+        _used_cache_keys.add(key)
+        keys_by_path[path] = key
+        if key not in cache:
+            to_parse.setdefault(key, path)
+
+    if to_parse:
+        workers = min(len(to_parse), max_workers or os.cpu_count() or 1)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker) as pool:
+                for key, parsed in zip(to_parse, pool.map(_parse_snakefile_uncached, to_parse.values())):
+                    cache[key] = parsed
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed); finish whatever is left in this process
+            logger.warning(f"Parse worker pool broke ({e}); parsing remaining Snakefiles serially")
+            for key, path in to_parse.items():
+                if key not in cache:
+                    cache[key] = _parse_snakefile_uncached(path)
+
+    results = {}
+    for path in snakefile_paths:
+        key = keys_by_path.get(path)
+        results[path] = copy.deepcopy(cache[key]) if key else ([], set())
+    return results
+
+
+RULE_ATTRIBUTES_TO_EXTRACT = [
+    'name', 'input', 'output', 'params', 'resources',
+    'priority', 'log', 'benchmark', 'conda_env', 'container_img',
+    'env_modules', 'group', 'shadow_depth', 'wrapper'
+]
+
+# Per Rule class: (public name, attribute actually holding it)
+_RULE_ATTR_CACHE: Dict[type, List[Tuple[str, str]]] = {}
+
+
+def _resolve_rule_attrs(rule: Any) -> List[Tuple[str, str]]:
+    """
+    Probe a rule once for each extracted attribute, preferring the public name over the
+    _private one, and cache the result for its class. Rule sets its attributes in
+    __init__, so the probe has to look at an instance rather than the class.
+    """
+    resolved = []
+    for attr in RULE_ATTRIBUTES_TO_EXTRACT:
+        if hasattr(rule, attr):
+            resolved.append((attr, attr))
+        elif hasattr(rule, f"_{attr}"):
+            resolved.append((attr, f"_{attr}"))
+    _RULE_ATTR_CACHE[type(rule)] = resolved
+    return resolved
+
+
+_IDENTITY_ATTRIBUTES = ('name', 'wrapper')
+
+
+def _is_demo_candidate(rule: Any, resolved: List[Tuple[str, str]], leaf_rule_names: Set[str], num_rules: int) -> bool:
+    """
+    Mirror the demo selection in generate_demo_calls_for_wrapper: a wrapper rule that is
+    a DAG leaf or the only rule in the Snakefile.
+    """
+    actual_names = dict(resolved)
+    if 'wrapper' not in actual_names or not getattr(rule, actual_names['wrapper'], None):
+        return False
+    return num_rules == 1 or getattr(rule, actual_names.get('name', 'name'), None) in leaf_rule_names
+
+
+def _parse_snakefile_uncached(snakefile_path: str) -> Tuple[List[Dict[str, Any]], Set[str]]:
     original_sys_path = sys.path[:]
     original_cwd = os.getcwd()
 
@@ -104,9 +344,7 @@ def parse_snakefile_with_api(snakefile_path: str) -> Tuple[List[Dict[str, Any]],
             DeploymentSettings, OutputSettings
         from snakemake.settings.enums import Quietness
 
-        workdir = Path(snakefile_path).parent
-        os.chdir(workdir)
-        relative_snakefile_path = Path(Path(snakefile_path).name)
+        snakefile = Path(snakefile_path).absolute()
 
         config_settings = ConfigSettings()
         resource_settings = ResourceSettings()
@@ -123,8 +361,8 @@ def parse_snakefile_with_api(snakefile_path: str) -> Tuple[List[Dict[str, Any]],
                 workflow_settings=workflow_settings,
                 storage_settings=storage_settings,
                 deployment_settings=deployment_settings,
-                snakefile=relative_snakefile_path,
-                workdir=Path.cwd()
+                snakefile=snakefile,
+                workdir=snakefile.parent
             )
             internal_workflow = workflow_api._workflow
 
@@ -135,22 +373,19 @@ def parse_snakefile_with_api(snakefile_path: str) -> Tuple[List[Dict[str, Any]],
 
             # Extract information from all rules
             parsed_rules = []
-            for rule in internal_workflow.rules:
+            # The params debug line formats the whole value; skip that unless it will be logged
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
+            rules = list(internal_workflow.rules)
+            for rule in rules:
                 rule_dict = {}
-                attributes_to_extract = [
-                    'name', 'input', 'output', 'params', 'resources', 
-                    'priority', 'log', 'benchmark', 'conda_env', 'container_img',
-                    'env_modules', 'group', 'shadow_depth', 'wrapper'
-                ]
-                for attr in attributes_to_extract:
-                    val = None
-                    attr_private = f"_{attr}"
-                    if hasattr(rule, attr):
-                        val = getattr(rule, attr)
-                    elif hasattr(rule, attr_private):
-                        val = getattr(rule, attr_private) # Corrected this line
-                    
-                    if attr == 'params': # Specific logging for params
+                resolved = _RULE_ATTR_CACHE.get(type(rule)) or _resolve_rule_attrs(rule)
+                if not _is_demo_candidate(rule, resolved, leaf_rule_names, len(rules)):
+                    # Only name and wrapper are ever read for rules that can't become demos
+                    resolved = [(attr, actual) for attr, actual in resolved if attr in _IDENTITY_ATTRIBUTES]
+                for attr, actual in resolved:
+                    val = getattr(rule, actual, None)
+
+                    if attr == 'params' and debug_enabled: # Specific logging for params
                         logger.debug(f"Before serialization - rule.params: type={type(val)}, value={val}")
 
                     if val is not None:
@@ -164,11 +399,15 @@ def parse_snakefile_with_api(snakefile_path: str) -> Tuple[List[Dict[str, Any]],
             return parsed_rules, leaf_rule_names
 
     except Exception as e:
-        print(f"Error parsing Snakefile with API: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        # Some test Snakefiles are expected not to parse; only format the traceback when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.exception(f"Error parsing Snakefile {snakefile_path} with API")
+        else:
+            logger.warning(f"Error parsing Snakefile {snakefile_path} with API: {e}")
         return [], set()
     finally:
+        # Snakemake's workflow API changes into workdir itself, so CWD is still
+        # process-global here; restore it, and use processes (parse_snakefiles_bulk) for parallelism
         os.chdir(original_cwd)
         sys.path = original_sys_path
 
@@ -191,16 +430,14 @@ def _has_wildcards(data: Any) -> bool:
     return False
 
 
-def generate_demo_calls_for_wrapper(wrapper_path: str, wrappers_root: str) -> List[Dict[str, Any]]:
+def demo_snakefile_for_wrapper(wrapper_path: str) -> Optional[Path]:
     """
-    Generate demo calls for a wrapper by analyzing its test Snakefile's DAG
-    to find executable leaf rules that point to the correct wrapper.
+    Return the wrapper's test Snakefile if it can be parsed for demos, else None.
     """
-    test_dir = Path(wrapper_path) / "test"
-    snakefile = test_dir / "Snakefile"
+    snakefile = Path(wrapper_path) / "test" / "Snakefile"
 
     if not snakefile.exists():
-        return []
+        return None
 
     # Read the Snakefile content as plain text to check for meta_wrapper directive
     # This avoids triggering remote calls via Snakemake API if meta_wrapper is present
@@ -209,9 +446,25 @@ def generate_demo_calls_for_wrapper(wrapper_path: str, wrappers_root: str) -> Li
             snakefile_content = f.read()
         if "meta_wrapper:" in snakefile_content:
             logger.debug(f"Skipping demo for wrapper '{wrapper_path}' due to 'meta_wrapper:' directive in {snakefile}")
-            return []
+            return None
     except Exception as e:
         logger.error(f"Error reading {snakefile} to check for meta_wrapper: {e}")
+        return None
+    return snakefile
+
+
+def _strip_master(wrapper_directive: str) -> str:
+    # Remove 'master/' prefix if present, as per user instruction
+    return wrapper_directive[len("master/"):] if wrapper_directive.startswith("master/") else wrapper_directive
+
+
+def generate_demo_calls_for_wrapper(wrapper_path: str, wrappers_root: str) -> List[Dict[str, Any]]:
+    """
+    Generate demo calls for a wrapper by analyzing its test Snakefile's DAG
+    to find executable leaf rules that point to the correct wrapper.
+    """
+    snakefile = demo_snakefile_for_wrapper(wrapper_path)
+    if snakefile is None:
         return []
 
     parsed_rules, leaf_rule_names = parse_snakefile_with_api(str(snakefile))
@@ -223,19 +476,18 @@ def generate_demo_calls_for_wrapper(wrapper_path: str, wrappers_root: str) -> Li
     current_wrapper_path = Path(wrapper_path).resolve()
     wrappers_root_path = Path(wrappers_root).resolve()
 
+    # Wrapper directives are posix-style relative paths; compare them as strings
+    current_wrapper_rel_path = current_wrapper_path.relative_to(wrappers_root_path).as_posix()
+
     for rule_info in parsed_rules:
         wrapper_directive = rule_info.get("wrapper", "")
         if not wrapper_directive:
             continue
 
-        # Remove 'master/' prefix if present, as per user instruction
-        if wrapper_directive.startswith("master/"):
-            wrapper_directive = wrapper_directive[len("master/"):]
-
         is_leaf = rule_info.get("name") in leaf_rule_names
         
         # Compare the wrapper directive (relative path) with the relative path of the current wrapper
-        is_correct_wrapper = (Path(wrapper_directive) == current_wrapper_path.relative_to(wrappers_root_path))
+        is_correct_wrapper = (_strip_master(wrapper_directive).rstrip("/") == current_wrapper_rel_path)
 
         # A rule is a valid demo if it's a correct self-test AND either:
         # a) it's a leaf rule in a DAG, OR
@@ -263,11 +515,7 @@ def convert_rule_to_tool_process_call(rule_info: Dict[str, Any]) -> Dict[str, An
     params = rule_info.get('params', {})
 
     # Extract the wrapper path from the 'wrapper' directive
-    wrapper_directive = rule_info.get('wrapper', '')
-    if wrapper_directive.startswith("master/"):
-        wrapper_name = wrapper_directive[len("master/"):]
-    else:
-        wrapper_name = wrapper_directive
+    wrapper_name = _strip_master(rule_info.get('wrapper', ''))
 
     # Only return user-modifiable fields, not Snakemake internal fields
     result = {
@@ -1,20 +1,261 @@
 """
 Utility functions for handling Snakemake API responses.
 """
+import asyncio
 import logging
 import shutil
 import os
+import yaml
 from pathlib import Path
-from typing import Any, Optional
-from .schemas import SnakemakeResponse
+from typing import Any, Callable, Dict, List, Optional, TextIO, Union
+from .schemas import InternalWrapperRequest, SnakemakeResponse
 
 logger = logging.getLogger(__name__)
 
+# libyaml-backed safe loader/dumper, several times faster than the pure-Python ones
+YAML_SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_SAFE_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+# Linux ioctl that shares a file's extents with another (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copy-on-write clone of src to dst; returns False if the filesystem can't do it."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    copytree copy_function: hard-link when possible, else reflink, else fall back to
+    copy2 (e.g. across filesystems without copy-on-write support).
+    """
+    if os.path.lexists(dst):
+        if os.path.samefile(src, dst):
+            return dst
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        if not _reflink(src, dst):
+            shutil.copy2(src, dst)
+    return dst
+
+
+def _create_log_dirs(log: Union[Dict, List, None], execution_workdir: Path) -> None:
+    """Pre-emptively create log directories to handle buggy wrappers."""
+    if not isinstance(log, (dict, list)) or not log:
+        return
+    log_files = log.values() if isinstance(log, dict) else log
+
+    # Paths in the payload are relative to the workdir; many logs share one directory
+    for log_dir in {(execution_workdir / log_file).parent for log_file in log_files}:
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+
+def _write_snakefile_to_fd(snakefile_fd: int, write_snakefile: Callable[..., None], **kwargs) -> None:
+    with open(snakefile_fd, 'w', encoding='utf-8', buffering=65536) as snakefile:
+        write_snakefile(snakefile, **kwargs)
+
+
+async def prepare_execution_workdir(
+    request: InternalWrapperRequest,
+    execution_workdir: Path,
+    abs_wrappers_path: Path,
+    snakefile_fd: int,
+    write_snakefile: Callable[..., None],
+) -> Optional[str]:
+    """
+    Copy the wrapper's conda environment, create log directories and write the Snakefile
+    to snakefile_fd concurrently in worker threads. Returns the conda env path to use in
+    the Snakefile, relative to the workdir, or None.
+    """
+    conda_env_filename = "environment.yaml"
+    potential_conda_env_path = abs_wrappers_path / request.wrapper_id / conda_env_filename
+    resolved_conda_env_path_for_snakefile = None
+    if potential_conda_env_path.exists():
+        resolved_conda_env_path_for_snakefile = conda_env_filename # Use relative path within workdir
+    else:
+        logger.debug(f"No environment.yaml found for wrapper {request.wrapper_id} at {potential_conda_env_path}")
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            if resolved_conda_env_path_for_snakefile:
+                # Copy, never link: a shared inode would let edits in the workdir reach the wrapper repo
+                tg.create_task(asyncio.to_thread(shutil.copy2, potential_conda_env_path, execution_workdir / conda_env_filename))
+            tg.create_task(asyncio.to_thread(_create_log_dirs, request.log, execution_workdir))
+            tg.create_task(asyncio.to_thread(
+                _write_snakefile_to_fd,
+                snakefile_fd,
+                write_snakefile,
+                request=request,
+                wrappers_path=str(abs_wrappers_path),
+                conda_env_path_for_snakefile=resolved_conda_env_path_for_snakefile, # Pass the relative path
+            ))
+    except ExceptionGroup as eg:
+        # Log every failure, then raise the first one chained to the whole group
+        for error in eg.exceptions:
+            logger.error(f"Preparing {execution_workdir} failed: {error!r}")
+        raise eg.exceptions[0] from eg
+
+    if resolved_conda_env_path_for_snakefile:
+        logger.debug(f"Conda environment {potential_conda_env_path} copied to {execution_workdir / conda_env_filename}")
+    return resolved_conda_env_path_for_snakefile
+
+
+def has_snakemake_locks(workdir: Path) -> bool:
+    """True if a previous Snakemake run left lock files in workdir."""
+    try:
+        with os.scandir(workdir / ".snakemake" / "locks") as entries:
+            return any(True for _ in entries)
+    except OSError:
+        return False
+
+
+def write_wrapper_snakefile(
+    snakefile: TextIO,
+    request: InternalWrapperRequest,
+    wrappers_path: str,
+    conda_env_path_for_snakefile: Optional[str] = None,
+    k8s_container_image: Optional[str] = None,
+) -> None:
+    """
+    Write the Snakefile for a single wrapper rule line by line to the given text stream.
+    With k8s_container_image, the image goes into the rule's resources for the Kubernetes
+    executor instead of a container directive.
+    """
+    def emit(line: str) -> None:
+        snakefile.write(line)
+        snakefile.write("\n")
+
+    # Build the rule definition
+    emit("rule run_single_wrapper:")
+    
+    wrapper_name = request.wrapper_id
+    logger.debug(f"Generating Snakefile for wrapper: {wrapper_name} with wrappers_path: {wrappers_path}")
+
+    # Remove "master/" prefix from wrapper_name if it exists, as per user's instruction
+    if wrapper_name.startswith("master/"):
+        wrapper_name = wrapper_name[len("master/"):]
+
+    # Inputs
+    if request.inputs:
+        if isinstance(request.inputs, dict):
+            emit("    input:")
+            for k, v in request.inputs.items():
+                emit(f'        {k}={v!r},')
+        elif isinstance(request.inputs, list):
+            input_strs = [f'"{inp}"' for inp in request.inputs]
+            emit(f"    input: {', '.join(input_strs)}")
+    
+    # Outputs
+    if request.outputs:
+        if isinstance(request.outputs, dict):
+            emit("    output:")
+            for k, v in request.outputs.items():
+                if isinstance(v, dict) and v.get('is_directory'):
+                    path = v.get('path')
+                    emit(f'        {k}=directory("{path}"),')
+                else:
+                    emit(f'        {k}={v!r},')
+        elif isinstance(request.outputs, list):
+            # This branch might need similar logic if unnamed outputs can be directories
+            output_strs = []
+            for out in request.outputs:
+                if isinstance(out, dict) and out.get('is_directory'):
+                    path = out.get('path')
+                    output_strs.append(f'directory("{path}")')
+                else:
+                    output_strs.append(f'"{out}"')
+            emit(f"    output: {', '.join(output_strs)}")
+
+    
+    # Params
+    if request.params is not None:
+        if isinstance(request.params, dict):
+            emit("    params:")
+            for k, v in request.params.items():
+                emit(f'        {k}={v!r},')
+        else:
+            emit(f"    params: {request.params!r}")
+    
+    # Log
+    if request.log:
+        if isinstance(request.log, dict):
+            emit("    log:")
+            for k, v in request.log.items():
+                emit(f'        {k}={v!r},')
+        elif isinstance(request.log, list):
+            log_strs = [f'"{lg}"' for lg in request.log]
+            emit(f"    log: {', '.join(log_strs)}")
+    
+    # Threads
+    if request.threads is not None:
+        emit(f"    threads: {request.threads}")
+    
+    # Resources
+    if k8s_container_image:
+        # The Kubernetes executor reads the image from resources; the block is never empty
+        emit("    resources:")
+        emit(f'        container_image="{k8s_container_image}",')
+    elif request.resources:
+        emit("    resources:")
+    if request.resources:
+        for k, v in request.resources.items():
+            if callable(v) or (isinstance(v, str) and v == "<callable>"):
+                continue
+            emit(f'        {k}={v},')
+    
+    # Priority
+    if request.priority is not None:
+        emit(f"    priority: {request.priority}")
+    
+    # Shadow
+    if request.shadow_depth:
+        emit(f"    shadow: '{request.shadow_depth}'")
+    
+    # Benchmark
+    if request.benchmark:
+        emit(f"    benchmark: '{request.benchmark}'")
+    
+    # Conda
+    if conda_env_path_for_snakefile:
+        emit(f"    conda: '{conda_env_path_for_snakefile}'")
+    
+    # Container
+    if request.container_img and not k8s_container_image:
+        emit(f'    container: "{request.container_img}"')
+    
+    # Group
+    if request.group:
+        emit(f'    group: "{request.group}"')
+    
+    # Environment modules
+    if request.env_modules:
+        emit(f"    # env_modules: {request.env_modules}")
+    
+    # Wrapper
+    emit(f'    wrapper: "{wrapper_name}"')
+
 
 def setup_demo_workdir(demo_workdir: str, workdir: str):
     """
     Copies all files and directories from a demo source to a destination workdir.
-    Handles symbolic links by copying them as symlinks.
+    Handles symbolic links by copying them as symlinks. Regular files are hard-linked
+    when source and destination share a filesystem.
     
     Args:
         demo_workdir (str): The source directory containing the demo files.
@@ -33,8 +274,15 @@ def setup_demo_workdir(demo_workdir: str, workdir: str):
     logger.debug(f"Copying demo files from {demo_path} to {dest_path}")
     try:
         # Use shutil.copytree to copy the entire directory, preserving symlinks
-        # and allowing copying into an existing directory.
-        shutil.copytree(demo_path, dest_path, symlinks=True, dirs_exist_ok=True)
+        # and allowing copying into an existing directory. Demo inputs are read-only
+        # test data, so they are hard-linked instead of copied byte for byte.
+        shutil.copytree(
+            demo_path,
+            dest_path,
+            symlinks=True,
+            dirs_exist_ok=True,
+            copy_function=link_or_copy,
+        )
     except Exception as e:
         logger.error(f"Failed to copy demo directory {demo_path} to {dest_path}: {e}")
         raise
@@ -7,7 +7,7 @@ from pathlib import Path
 from typing import Dict, Optional, Union
 import yaml
 import collections.abc
-from .utils import sync_workdir_to_s3
+from .utils import sync_workdir_to_s3, YAML_SAFE_LOADER, YAML_SAFE_DUMPER
 
 logger = logging.getLogger(__name__)
 
@@ -54,13 +54,13 @@ async def run_workflow(
         base_config = {}
         if original_config_path.exists():
             with open(original_config_path, 'r') as f:
-                base_config = yaml.safe_load(f) or {}
+                base_config = yaml.load(f, Loader=YAML_SAFE_LOADER) or {}
         merged_config = deep_merge(config_overrides, base_config)
 
         # Ensure config dir exists
         (execution_path / "config").mkdir(parents=True, exist_ok=True)
         with open(execution_path / "config" / "config.yaml", 'w') as f:
-            yaml.dump(merged_config, f)
+            yaml.dump(merged_config, f, Dumper=YAML_SAFE_DUMPER)
 
         # Setup logging
         if job_id:
@@ -104,7 +104,7 @@ async def run_workflow(
             if config_file.exists():
                 try:
                     with open(config_file, 'r') as f:
-                        profile_config = yaml.safe_load(f) or {}
+                        profile_config = yaml.load(f, Loader=YAML_SAFE_LOADER) or {}
                     
                     provider = profile_config.get("default-storage-provider") or profile_config.get("default_storage_provider")
                     prefix_val = profile_config.get("default-storage-prefix") or profile_config.get("default_storage_prefix")
@@ -126,7 +126,7 @@ async def run_workflow(
                         if not provider: profile_config["default-storage-provider"] = "s3"
                         
                         with open(config_file, 'w') as f:
-                            yaml.dump(profile_config, f)
+                            yaml.dump(profile_config, f, Dumper=YAML_SAFE_DUMPER)
                         logger.info(f"Using dynamic S3 prefix: {dynamic_prefix}")
                 except Exception as e:
                     logger.error(f"Failed to update profile for in-place run: {e}")
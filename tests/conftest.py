@@ -1,10 +1,12 @@
 import pytest
 import asyncio
 import os
+import orjson
 import tempfile
 import shutil
 from pathlib import Path
 import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
 from snakemake_mcp_server.schemas import InternalWrapperRequest
 
 @pytest.fixture(scope="module")
@@ -30,6 +32,20 @@ def wrappers_path(snakebase_dir):
 def workflows_dir(snakebase_dir):
     return os.path.join(snakebase_dir, "snakemake-workflows")
 
+@pytest_asyncio.fixture(scope="session")
+async def fastapi_app(wrappers_path, workflows_dir):
+    """整个测试会话共享一个 FastAPI 应用，lifespan 启动和关闭各只执行一次"""
+    from snakemake_mcp_server.api.main import create_native_fastapi_app
+    app = create_native_fastapi_app(wrappers_path, workflows_dir)
+    async with app.router.lifespan_context(app):
+        yield app
+
+@pytest_asyncio.fixture
+async def rest_client(fastapi_app):
+    """在会话共享的 FastAPI 应用上创建进程内的异步客户端"""
+    async with AsyncClient(transport=ASGITransport(app=fastapi_app), base_url="http://test") as client:
+        yield client
+
 @pytest_asyncio.fixture(scope="function")
 async def run_wrapper_test():
     """创建一个封装了run_wrapper调用的fixture，接口与/tool-processes相同"""
@@ -72,4 +88,22 @@ def test_files():
     try:
         shutil.rmtree(temp_dir)
     except Exception as e:
-        print(f"Warning: Failed to clean up {temp_dir}: {e}")
\ No newline at end of file
+        print(f"Warning: Failed to clean up {temp_dir}: {e}")
+
+@pytest.fixture
+def poll_until_terminal():
+    """通过 /wait 长轮询任务状态，直到完成、失败或超时"""
+    async def poll(client, url, *, timeout=120):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        data = {}
+        while (remaining := deadline - loop.time()) > 0:
+            response = await client.get(f"{url}/wait", params={"timeout": min(remaining, 300)})
+            assert response.status_code == 200
+            data = orjson.loads(response.content)
+            print(f"Polling {url}, status: {data['status']}")
+            if data["status"] in ["completed", "failed"]:
+                break
+        return data
+
+    return poll
@@ -0,0 +1,41 @@
+import pytest
+from snakemake_mcp_server.api.routes import tool_processes
+
+
+@pytest.fixture
+def shared_root(tmp_path, monkeypatch):
+    """Point /download at a SHARED_ROOT holding two jobs, each with one output file."""
+    root = tmp_path / "shared"
+    for job_id in ("myjob", "otherjob"):
+        (root / job_id).mkdir(parents=True)
+        (root / job_id / "x").write_text(f"output of {job_id}")
+    monkeypatch.setattr(tool_processes, "BASE_DIR_ABS", root.resolve())
+    return root
+
+
+@pytest.mark.asyncio
+async def test_download_own_file(rest_client, shared_root):
+    response = await rest_client.get("/download", params={"job_id": "myjob", "file_name": "x"})
+    assert response.status_code == 200
+    assert response.content == b"output of myjob"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("job_id, file_name", [
+    ("myjob", "../otherjob/x"),
+    ("..", "shared/otherjob/x"),
+    ("myjob/../otherjob", "x"),
+    ("otherjob/.", "x"),
+    (".", "otherjob/x"),
+    ("myjob", "../../shared/otherjob/x"),
+])
+async def test_download_rejects_other_jobs_files(rest_client, shared_root, job_id, file_name):
+    response = await rest_client.get("/download", params={"job_id": job_id, "file_name": file_name})
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_download_rejects_symlink_out_of_job_dir(rest_client, shared_root):
+    (shared_root / "myjob" / "link").symlink_to(shared_root / "otherjob" / "x")
+    response = await rest_client.get("/download", params={"job_id": "myjob", "file_name": "link"})
+    assert response.status_code == 403
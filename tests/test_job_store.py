@@ -0,0 +1,113 @@
+import pytest
+from datetime import datetime, timezone
+from snakemake_mcp_server import jobs
+from snakemake_mcp_server.jobs import JobStore
+from snakemake_mcp_server.schemas import Job, JobStatus
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(jobs.time, "monotonic", fake)
+    return fake
+
+
+def make_job(job_id: str, status: JobStatus) -> Job:
+    return Job(job_id=job_id, status=status, created_time=datetime.now(timezone.utc))
+
+
+def test_ttl_counts_from_completion_not_submission(clock):
+    store = JobStore(maxsize=100, ttl=10)
+    store["long"] = make_job("long", JobStatus.RUNNING)
+
+    # Running well past the TTL does not count against it
+    clock.now += 60
+    store["other"] = make_job("other", JobStatus.RUNNING)
+    assert "long" in store
+
+    store["long"].status = JobStatus.COMPLETED
+    store.mark_finished("long")
+    clock.now += 5
+    store["trigger"] = make_job("trigger", JobStatus.ACCEPTED)
+    assert "long" in store
+
+    clock.now += 6
+    store["trigger2"] = make_job("trigger2", JobStatus.ACCEPTED)
+    assert "long" not in store
+    assert {"other", "trigger", "trigger2"} <= set(j.job_id for j in store.snapshot())
+
+
+def test_jobs_inserted_finished_expire_after_ttl(clock):
+    store = JobStore(maxsize=100, ttl=10)
+    store["done"] = make_job("done", JobStatus.FAILED)
+    clock.now += 11
+    store["new"] = make_job("new", JobStatus.ACCEPTED)
+    assert "done" not in store
+    assert "new" in store
+
+
+def test_on_evict_is_called_for_every_job_that_leaves(clock):
+    evicted = []
+    store = JobStore(maxsize=100, ttl=10, on_evict=evicted.append)
+    store["done"] = make_job("done", JobStatus.COMPLETED)
+    store["running"] = make_job("running", JobStatus.RUNNING)
+    clock.now += 11
+    store["new"] = make_job("new", JobStatus.ACCEPTED)
+    assert evicted == ["done"]
+
+    del store["running"]
+    assert evicted == ["done", "running"]
+
+
+def test_maxsize_evicts_earliest_finished_jobs_only(clock):
+    store = JobStore(maxsize=3, ttl=3600)
+    store["running"] = make_job("running", JobStatus.RUNNING)
+    store["a"] = make_job("a", JobStatus.RUNNING)
+    store["b"] = make_job("b", JobStatus.COMPLETED)
+
+    # "a" finishes after "b", so "b" is the earliest finished job
+    clock.now += 1
+    store["a"].status = JobStatus.COMPLETED
+    store.mark_finished("a")
+
+    store["c"] = make_job("c", JobStatus.ACCEPTED)
+    assert len(store) == 3
+    assert "b" not in store
+    assert {"running", "a", "c"} == set(j.job_id for j in store.snapshot())
+
+    # Only unfinished jobs left besides "a"; running jobs are never evicted
+    store["d"] = make_job("d", JobStatus.ACCEPTED)
+    assert "a" not in store
+    store["e"] = make_job("e", JobStatus.ACCEPTED)
+    assert len(store) == 4
+    assert {"running", "c", "d", "e"} == set(j.job_id for j in store.snapshot())
+
+
+def test_notify_job_finished_starts_the_ttl(clock, monkeypatch):
+    store = JobStore(maxsize=100, ttl=10)
+    monkeypatch.setattr(jobs, "job_store", store)
+    store["job"] = make_job("job", JobStatus.RUNNING)
+    # Just before submit + TTL the job is still there
+    clock.now += 9
+    store["trigger"] = make_job("trigger", JobStatus.ACCEPTED)
+    assert "job" in store
+
+    store["job"].status = JobStatus.COMPLETED
+    jobs.notify_job_finished("job")
+    # Past submit + TTL, but within notify + TTL
+    clock.now += 9
+    store["trigger2"] = make_job("trigger2", JobStatus.ACCEPTED)
+    assert "job" in store
+
+    # Past notify + TTL
+    clock.now += 2
+    store["trigger3"] = make_job("trigger3", JobStatus.ACCEPTED)
+    assert "job" not in store
@@ -1,25 +1,22 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 import logging
 import json
-import os
-from pathlib import Path
+import orjson
 from snakemake_mcp_server.api.main import create_native_fastapi_app
-from snakemake_mcp_server.schemas import UserWrapperRequest
+from datetime import datetime, timezone
+from snakemake_mcp_server.jobs import job_store, notify_job_finished, wait_for_job
+from snakemake_mcp_server.schemas import Job, JobStatus, UserWrapperRequest
 
 @pytest.fixture
-def rest_client():
-    """Create a TestClient for the FastAPI application."""
-    snakebase_dir_env = os.environ.get("SNAKEBASE_DIR")
-    if not snakebase_dir_env:
-        pytest.fail("SNAKEBASE_DIR environment variable not set.")
-    snakebase_dir = Path(snakebase_dir_env).resolve()
-    wrappers_path = str(snakebase_dir / "snakemake-wrappers")
-    workflows_dir = str(snakebase_dir / "snakemake-workflows")
-    
+def rest_client(wrappers_path, workflows_dir):
+    """Create a TestClient for the FastAPI application, running its lifespan."""
     app = create_native_fastapi_app(wrappers_path, workflows_dir)
-    return TestClient(app)
+    with TestClient(app) as client:
+        yield client
 
+@pytest.mark.xdist_group(name="job_store")
 def test_list_jobs_empty(rest_client: TestClient):
     """
     Tests if the API correctly returns an empty list of jobs when no jobs have been submitted.
@@ -29,13 +26,14 @@ def test_list_jobs_empty(rest_client: TestClient):
     response = rest_client.get("/tool-processes/")
     assert response.status_code == 200, "Failed to get empty list of jobs"
     
-    data = response.json()
+    data = orjson.loads(response.content)
     assert "jobs" in data, "The 'jobs' field is missing from the response."
     assert isinstance(data["jobs"], list), "The 'jobs' field is not a list."
     assert len(data["jobs"]) == 0, "The 'jobs' list is not empty."
 
     logging.info("Successfully received empty list of jobs.")
 
+@pytest.mark.xdist_group(name="job_store")
 @pytest.mark.asyncio
 async def test_list_jobs_with_one_job(rest_client: TestClient):
     """
@@ -54,14 +52,14 @@ async def test_list_jobs_with_one_job(rest_client: TestClient):
     
     response = rest_client.post("/tool-processes", json=request.model_dump())
     assert response.status_code == 202, "Failed to submit job"
-    job_submission_response = response.json()
+    job_submission_response = orjson.loads(response.content)
     job_id = job_submission_response["job_id"]
 
     # 2. Get the list of jobs
     response = rest_client.get("/tool-processes/")
     assert response.status_code == 200, "Failed to get list of jobs"
     
-    data = response.json()
+    data = orjson.loads(response.content)
     assert "jobs" in data, "The 'jobs' field is missing from the response."
     assert isinstance(data["jobs"], list), "The 'jobs' field is not a list."
     assert len(data["jobs"]) > 0, "The 'jobs' list is empty."
@@ -71,3 +69,27 @@ async def test_list_jobs_with_one_job(rest_client: TestClient):
     assert job_id in job_ids, "The submitted job is not in the list of jobs."
 
     logging.info("Successfully listed jobs with one job.")
+
+@pytest.mark.xdist_group(name="job_store")
+@pytest.mark.asyncio
+async def test_wait_for_job_returns_when_job_finishes():
+    """
+    Tests that a long-poll waiter wakes up as soon as the job reaches a final status.
+    """
+    job_id = "wait-for-job-test"
+    job_store[job_id] = Job(job_id=job_id, status=JobStatus.RUNNING, created_time=datetime.now(timezone.utc))
+    try:
+        waiter = asyncio.create_task(wait_for_job(job_id, timeout=30))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        job_store[job_id].status = JobStatus.COMPLETED
+        notify_job_finished(job_id)
+        job = await asyncio.wait_for(waiter, timeout=1)
+        assert job.status == JobStatus.COMPLETED
+
+        # Finished jobs are returned immediately
+        job = await wait_for_job(job_id, timeout=30)
+        assert job.status == JobStatus.COMPLETED
+    finally:
+        del job_store[job_id]
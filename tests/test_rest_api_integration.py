@@ -1,34 +1,17 @@
 import pytest
 import asyncio
-import os
-from fastapi.testclient import TestClient
-from snakemake_mcp_server.api.main import create_native_fastapi_app
-import tempfile
-import time
+import orjson
 from pathlib import Path
 import shutil
 from snakemake_mcp_server.schemas import UserWrapperRequest, InternalWrapperRequest, PlatformRunParams
 
 
-@pytest.fixture
-def rest_client():
-    """Create a TestClient for the FastAPI application."""
-    snakebase_dir_env = os.environ.get("SNAKEBASE_DIR")
-    if not snakebase_dir_env:
-        pytest.fail("SNAKEBASE_DIR environment variable not set.")
-    snakebase_dir = Path(snakebase_dir_env).resolve()
-    wrappers_path = str(snakebase_dir / "snakemake-wrappers")
-    workflows_dir = str(snakebase_dir / "snakemake-workflows")
-    
-    app = create_native_fastapi_app(wrappers_path, workflows_dir)
-    return TestClient(app)
-
-
+@pytest.mark.xdist_group(name="job_store")
 @pytest.mark.asyncio
 async def test_direct_fastapi_wrapper_execution(rest_client):
     """Test direct FastAPI wrapper execution."""
     # Test wrapper execution using direct FastAPI access
-    response = rest_client.post("/tool-processes", json={
+    response = await rest_client.post("/tool-processes", json={
         "wrapper_id": "bio/fastqc",
         "inputs": ["test.fastq"],
         "outputs": ["test_fastqc.html", "test_fastqc.zip"],
@@ -41,23 +24,47 @@ async def test_direct_fastapi_wrapper_execution(rest_client):
 @pytest.mark.asyncio
 async def test_direct_fastapi_wrapper_list(rest_client):
     """Test direct FastAPI wrapper listing."""
-    response = rest_client.get("/tools")
+    response = await rest_client.get("/tools")
     
     assert response.status_code == 200
-    result = response.json()
+    result = orjson.loads(response.content)
     assert "wrappers" in result
     assert "total_count" in result
     print(f"Direct FastAPI found {result['total_count']} wrappers")
 
 
+@pytest.mark.asyncio
+async def test_direct_fastapi_wrapper_list_page(rest_client):
+    """Test that /tools honours limit and offset and reports the unpaged total."""
+    full = orjson.loads((await rest_client.get("/tools")).content)
+    response = await rest_client.get("/tools", params={"limit": 1, "offset": 1})
+
+    assert response.status_code == 200
+    result = orjson.loads(response.content)
+    assert result["total_count"] == full["total_count"]
+    assert [w["id"] for w in full["wrappers"]] == sorted(w["id"] for w in full["wrappers"])
+    expected = [w["id"] for w in full["wrappers"]][1:2]
+    assert [w["id"] for w in result["wrappers"]] == expected
+
+
+@pytest.mark.asyncio
+async def test_direct_fastapi_wrapper_list_with_demos(rest_client):
+    """Test that /tools?include=demos embeds a demos list in each entry."""
+    response = await rest_client.get("/tools", params={"include": "demos", "limit": 5})
+
+    assert response.status_code == 200
+    result = orjson.loads(response.content)
+    assert all(isinstance(wrapper["demos"], list) for wrapper in result["wrappers"])
+
+
 @pytest.mark.asyncio
 async def test_direct_fastapi_wrapper_metadata(rest_client):
     """Test direct FastAPI wrapper metadata retrieval."""
     test_tool_path = "bio/snpsift/varType"
-    response = rest_client.get(f"/tools/{test_tool_path}")
+    response = await rest_client.get(f"/tools/{test_tool_path}")
     
     assert response.status_code == 200
-    result = response.json()
+    result = orjson.loads(response.content)
     assert result["info"]["name"] == "SnpSift varType"
     print(f"Direct FastAPI metadata for {test_tool_path}: {result['info']['name']}")
     
@@ -77,10 +84,10 @@ async def test_direct_fastapi_demo_structure_validation(rest_client):
     test_tool_path = "bio/snpsift/varType"
     
     # Fetch demos from the /demos/wrappers/{wrapper_id} endpoint
-    response = rest_client.get(f"/demos/wrappers/{test_tool_path}")
+    response = await rest_client.get(f"/demos/wrappers/{test_tool_path}")
     assert response.status_code == 200
     
-    demos = response.json()
+    demos = orjson.loads(response.content)
     assert len(demos) > 0, f"Expected demos for {test_tool_path}, but got none"
     
     # Validate first demo
@@ -97,30 +104,39 @@ async def test_direct_fastapi_demo_structure_validation(rest_client):
     pass
 
 
+# (wrapper_id, inputs, outputs) for wrappers whose inputs /tool-processes can fabricate
+FULL_FLOW_CASES = [
+    ("bio/snpsift/varType", {"vcf": "in.vcf"}, {"vcf": "annotated/out.vcf"}),
+]
+
+
+@pytest.mark.xdist_group(name="job_store")
 @pytest.mark.asyncio
-async def test_snpsift_vartype_wrapper_full_flow(rest_client):
+@pytest.mark.parametrize("wrapper_id, inputs, outputs", FULL_FLOW_CASES, ids=[case[0] for case in FULL_FLOW_CASES])
+async def test_wrapper_full_flow(rest_client, poll_until_terminal, tmp_path: Path, wrapper_id, inputs, outputs):
     """
-    End-to-end test for running the 'bio/snpsift/varType' wrapper through the
-    /tool-processes endpoint, verifying job status and output file creation.
-    This test now relies on the /tool-processes endpoint to create dummy input files.
+    End-to-end test for running a wrapper through the /tool-processes endpoint,
+    verifying job status and output file creation.
+    This test relies on the /tool-processes endpoint to create dummy input files.
     """
-    # Construct the UserSnakemakeWrapperRequest payload
     # /tool-processes expects an InternalWrapperRequest
-    wrapper_id = "bio/snpsift/varType"
-    temp_dir = Path(tempfile.mkdtemp())
-    
     internal_payload = InternalWrapperRequest(
         wrapper_id=wrapper_id,
-        inputs={"vcf": "in.vcf"},
-        outputs={"vcf": "annotated/out.vcf"},
-        workdir=str(temp_dir), # Pass a temporary workdir
+        inputs=inputs,
+        outputs=outputs,
+        workdir=str(tmp_path), # Pass a temporary workdir
         threads=1 # Minimal platform param required
     )
 
     # Submit the job
-    response = rest_client.post("/tool-processes", json=internal_payload.model_dump(mode="json"))
+    # pydantic-core encodes the body directly; httpx does not re-encode it with stdlib json
+    response = await rest_client.post(
+        "/tool-processes",
+        content=internal_payload.model_dump_json(),
+        headers={"Content-Type": "application/json"},
+    )
     assert response.status_code == 202
-    submission_response = response.json()
+    submission_response = orjson.loads(response.content)
     job_id = submission_response["job_id"]
     status_url = submission_response["status_url"]
 
@@ -128,23 +144,9 @@ async def test_snpsift_vartype_wrapper_full_flow(rest_client):
     print(f"Status URL: {status_url}")
 
     # Poll job status
-    max_attempts = 60
-    attempts = 0
-    job_status = None
-    job_status_data = {}
-    while attempts < max_attempts:
-        time.sleep(1) # Wait for 1 second before polling again
-        status_response = rest_client.get(status_url)
-        assert status_response.status_code == 200
-        job_status_data = status_response.json()
-        job_status = job_status_data["status"]
-
-        print(f"Polling job {job_id}, status: {job_status}")
-
-        if job_status in ["completed", "failed"]:
-            break
-        attempts += 1
-    
+    job_status_data = await poll_until_terminal(rest_client, status_url, timeout=60)
+    job_status = job_status_data.get("status")
+
     assert job_status == "completed", f"Job failed or timed out. Final status: {job_status}, Result: {job_status_data.get('result')}"
 
     # Extract workdir and output file path from the job result
@@ -153,9 +155,7 @@ async def test_snpsift_vartype_wrapper_full_flow(rest_client):
     output_file_full_path = Path(job_result["output_files"][0])
     workdir = output_file_full_path.parent # The workdir is the parent of the output file
 
-    # Verify output file
-    # Give a small delay to ensure file system is updated
-    time.sleep(2)
+    # Verify output file; the job only completes after Snakemake has exited
     assert output_file_full_path.exists(), f"Output file {output_file_full_path} was not created."
     print(f"Output file {output_file_full_path} verified.")
 
@@ -163,6 +163,3 @@ async def test_snpsift_vartype_wrapper_full_flow(rest_client):
     if workdir.exists():
         shutil.rmtree(workdir)
         print(f"Cleaned up temporary directory: {workdir}")
-    if temp_dir.exists():
-        shutil.rmtree(temp_dir)
-        print(f"Cleaned up temporary directory: {temp_dir}")
\ No newline at end of file
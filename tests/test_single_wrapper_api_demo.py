@@ -2,25 +2,10 @@
 A fast, focused integration test for the asynchronous API flow.
 """
 import pytest
-from fastapi.testclient import TestClient
 import logging
 import json
-import os
-from pathlib import Path
-from snakemake_mcp_server.api.main import create_native_fastapi_app
+import orjson
 
-@pytest.fixture
-def rest_client():
-    """Create a TestClient for the FastAPI application."""
-    snakebase_dir_env = os.environ.get("SNAKEBASE_DIR")
-    if not snakebase_dir_env:
-        pytest.fail("SNAKEBASE_DIR environment variable not set.")
-    snakebase_dir = Path(snakebase_dir_env).resolve()
-    wrappers_path = str(snakebase_dir / "snakemake-wrappers")
-    workflows_dir = str(snakebase_dir / "snakemake-workflows")
-    
-    app = create_native_fastapi_app(wrappers_path, workflows_dir)
-    return TestClient(app)
 
 @pytest.mark.asyncio
 async def test_single_demo_api_flow(rest_client):
@@ -33,18 +18,18 @@ async def test_single_demo_api_flow(rest_client):
     wrapper_path = "bio/snpsift/varType"
     
     # Fetch the full metadata for this specific wrapper
-    metadata_response = rest_client.get(f"/tools/{wrapper_path}")
+    metadata_response = await rest_client.get(f"/tools/{wrapper_path}")
     assert metadata_response.status_code == 200, f"Failed to get metadata for {wrapper_path}"
     
-    metadata = metadata_response.json()
+    metadata = orjson.loads(metadata_response.content)
     logging.info(f"Received metadata for {wrapper_path}: {metadata.get('id')}")
     
     # Fetch demos from the separate endpoint
-    demos_response = rest_client.get(f"/demos/wrappers/{wrapper_path}")
+    demos_response = await rest_client.get(f"/demos/wrappers/{wrapper_path}")
     assert demos_response.status_code == 200, f"Failed to get demos for {wrapper_path}"
     
-    demos = demos_response.json()
-    
+    demos = orjson.loads(demos_response.content)
+
     # Print the received demos for debugging
     logging.info(f"Received demos for {wrapper_path}:\n{json.dumps(demos, indent=2)}")
     
@@ -0,0 +1,68 @@
+import os
+from snakemake_mcp_server import snakefile_parser
+from snakemake_mcp_server.snakefile_parser import _parse_cache_key
+
+SNAKEFILE = b'include: "rules.smk"\n'
+
+
+def _write_test_dir(path, rules=b"rule a:\n    output: 'x'\n"):
+    path.mkdir(parents=True)
+    (path / "Snakefile").write_bytes(SNAKEFILE)
+    (path / "rules.smk").write_bytes(rules)
+    return str(path / "Snakefile")
+
+
+def test_identical_snakefiles_in_different_dirs_get_different_keys(tmp_path):
+    first = _write_test_dir(tmp_path / "a" / "test")
+    second = _write_test_dir(tmp_path / "b" / "test")
+    assert _parse_cache_key(first, SNAKEFILE) != _parse_cache_key(second, SNAKEFILE)
+
+
+def test_changed_included_file_changes_key(tmp_path):
+    snakefile = _write_test_dir(tmp_path / "test")
+    before = _parse_cache_key(snakefile, SNAKEFILE)
+    rules = tmp_path / "test" / "rules.smk"
+    rules.write_bytes(b"rule b:\n    output: 'y'\n")
+    os.utime(rules, ns=(0, 0))
+    assert _parse_cache_key(snakefile, SNAKEFILE) != before
+
+
+def test_save_parse_cache_drops_entries_not_used_this_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(snakefile_parser, "PARSE_CACHE_FILE", tmp_path / "parser_cache.pkl")
+    monkeypatch.setattr(snakefile_parser, "_parse_cache", {
+        "used": ([{"name": "a"}], {"a"}),
+        "stale": ([{"name": "b"}], {"b"}),
+    })
+    monkeypatch.setattr(snakefile_parser, "_used_cache_keys", {"used"})
+    snakefile_parser.save_parse_cache()
+
+    monkeypatch.setattr(snakefile_parser, "_parse_cache", None)
+    assert set(snakefile_parser._get_parse_cache()) == {"used"}
+
+
+class _BrokenPool:
+    def __init__(self, max_workers, initializer):
+        self.max_workers = max_workers
+        _BrokenPool.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, paths):
+        raise snakefile_parser.BrokenProcessPool("worker died")
+
+
+def test_bulk_parse_sizes_pool_and_falls_back_to_serial(tmp_path, monkeypatch):
+    paths = [_write_test_dir(tmp_path / name / "test") for name in ("a", "b")]
+    _BrokenPool.instances = []
+    monkeypatch.setattr(snakefile_parser, "ProcessPoolExecutor", _BrokenPool)
+    monkeypatch.setattr(snakefile_parser, "_parse_cache", {})
+    monkeypatch.setattr(snakefile_parser, "_parse_snakefile_uncached", lambda path: ([{"name": path}], set()))
+
+    results = snakefile_parser.parse_snakefiles_bulk(paths, max_workers=8)
+
+    assert [pool.max_workers for pool in _BrokenPool.instances] == [2]
+    assert {path: rules[0]["name"] for path, (rules, _) in results.items()} == {path: path for path in paths}
@@ -0,0 +1,150 @@
+import asyncio
+import httpx
+import pytest
+from urllib.parse import parse_qs, urlsplit
+from snakemake_mcp_server.db import supabase_impl
+from snakemake_mcp_server.db.supabase_impl import SupabaseDB, _in_filter
+from snakemake_mcp_server.schemas import JobStatus
+
+
+class RecordingTransport:
+    """Answers every PostgREST call with an empty row list and records what was sent."""
+
+    def __init__(self):
+        self.requests = []
+        self.gate = None
+        self.status_code = 200
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.gate is not None:
+            await self.gate.wait()
+        return httpx.Response(self.status_code, json=[])
+
+    def patches(self):
+        return [
+            (parse_qs(urlsplit(str(r.url)).query)["task_id"][0], r.content)
+            for r in self.requests if r.method == "PATCH"
+        ]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(supabase_impl, "STATUS_FLUSH_INTERVAL", 0.01)
+    transport = RecordingTransport()
+    db = SupabaseDB()
+    db.table_name = "jobs"
+    db._http = httpx.AsyncClient(base_url="http://test/rest/v1/", transport=httpx.MockTransport(transport))
+    db.transport = transport
+    return db
+
+
+def test_in_filter_quotes_values():
+    assert _in_filter(['a,b', 'say "hi"']) == 'in.("a,b","say \\"hi\\"")'
+
+
+@pytest.mark.asyncio
+async def test_repeated_status_is_written_once(db):
+    await db.update_task_status_by_task_id("t1", JobStatus.RUNNING)
+    await db.update_task_status_by_task_id("t1", JobStatus.RUNNING)
+    assert [task_filter for task_filter, _ in db.transport.patches()] == ["eq.t1"]
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_status_write_is_retried(db, monkeypatch):
+    monkeypatch.setattr(supabase_impl, "_with_retry", lambda factory: factory())
+    db.transport.status_code = 503
+    with pytest.raises(httpx.HTTPStatusError):
+        await db.update_task_status_by_task_id("t1", JobStatus.RUNNING)
+
+    # The failed write was not remembered, so the same status goes out again
+    db.transport.status_code = 200
+    await db.update_task_status_by_task_id("t1", JobStatus.RUNNING)
+    assert [task_filter for task_filter, _ in db.transport.patches()] == ["eq.t1", "eq.t1"]
+    await db.close()
+
+
+def test_forget_task_drops_dedup_state(db):
+    db._last_status["t1"] = JobStatus.RUNNING
+    db._status_attempts["t1"] = 2
+    db.forget_task("t1")
+    db.forget_task("unknown")
+    assert db._last_status == {} and db._status_attempts == {}
+
+
+@pytest.mark.asyncio
+async def test_terminal_statuses_are_coalesced_per_status(db):
+    for task_id in ("t1", "t2", "t3"):
+        await db.update_task_status_by_task_id(task_id, JobStatus.COMPLETED)
+    await db.update_task_status_by_task_id("t4", JobStatus.FAILED)
+    assert db.transport.patches() == []
+
+    await db.flush_status_buffer()
+    filters = sorted(task_filter for task_filter, _ in db.transport.patches())
+    assert filters == ['in.("t1","t2","t3")', 'in.("t4")']
+    # Finished tasks are no longer tracked, and nothing is left to write
+    assert db._last_status == {} and db._status_buffer == {}
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_flusher_sleeps_until_a_status_is_buffered(db):
+    db._status_flusher = asyncio.create_task(db._flush_status_when_pending())
+    await asyncio.sleep(0.05)
+    assert db.transport.requests == []
+
+    await db.update_task_status_by_task_id("t1", JobStatus.COMPLETED)
+    await asyncio.sleep(0.05)
+    assert [task_filter for task_filter, _ in db.transport.patches()] == ['in.("t1")']
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_close_keeps_a_batch_the_flusher_was_writing(db):
+    db.transport.gate = asyncio.Event()
+    db._status_flusher = asyncio.create_task(db._flush_status_when_pending())
+    await db.update_task_status_by_task_id("t1", JobStatus.COMPLETED)
+    while not db.transport.requests:
+        await asyncio.sleep(0.005)
+
+    # The flusher is blocked mid-write; close() cancels it and must still persist t1
+    closing = asyncio.create_task(db.close())
+    await asyncio.sleep(0.01)
+    # The cancelled batch was put back and close() is already rewriting it
+    assert len(db.transport.requests) == 2
+    db.transport.gate.set()
+    await asyncio.wait_for(closing, timeout=1)
+    assert [task_filter for task_filter, _ in db.transport.patches()] == ['in.("t1")', 'in.("t1")']
+
+
+@pytest.mark.asyncio
+async def test_failing_flushes_back_off_then_drop_the_status(db, monkeypatch, caplog):
+    # One attempt per request, so each flush is exactly one failed PATCH
+    monkeypatch.setattr(supabase_impl, "_with_retry", lambda factory: factory())
+    db.transport.status_code = 503
+    await db.update_task_status_by_task_id("t1", JobStatus.COMPLETED)
+
+    delays = []
+    for _ in range(supabase_impl.STATUS_FLUSH_MAX_ATTEMPTS - 1):
+        await db.flush_status_buffer()
+        assert db._status_buffer == {"t1": JobStatus.COMPLETED}
+        delays.append(db._flush_delay)
+    assert delays == sorted(delays) and delays[0] > supabase_impl.STATUS_FLUSH_INTERVAL
+
+    # While backing off, a full buffer does not force extra flushes
+    await db.update_task_status_by_task_id("t2", JobStatus.COMPLETED)
+    sent = len(db.transport.requests)
+    monkeypatch.setattr(supabase_impl, "STATUS_FLUSH_MAX", 1)
+    await db.update_task_status_by_task_id("t3", JobStatus.COMPLETED)
+    assert len(db.transport.requests) == sent
+
+    caplog.clear()
+    await db.flush_status_buffer()
+    assert "t1" not in db._status_buffer and "t1" not in db._last_status
+    assert len([r for r in caplog.records if "Dropping" in r.getMessage()]) == 1
+
+    db.transport.status_code = 200
+    await db.flush_status_buffer()
+    assert db._status_buffer == {} and db._flush_delay == supabase_impl.STATUS_FLUSH_INTERVAL
+    await db.close()
@@ -5,11 +5,12 @@ import tempfile
 import shutil
 from pathlib import Path
 import yaml
-import time
+import orjson
 from unittest.mock import patch
 
 from snakemake_mcp_server.api.main import create_native_fastapi_app
 from snakemake_mcp_server.schemas import UserWorkflowRequest
+from snakemake_mcp_server.utils import YAML_SAFE_DUMPER
 
 @pytest.fixture(scope="module")
 def setup_test_environment():
@@ -49,7 +50,7 @@ rule create_output:
         # 2. Create config/config.yaml
         (workflow_path / "config").mkdir()
         (workflow_path / "config" / "config.yaml").write_text(
-            yaml.dump({"message": "default api message", "threads": 2})
+            yaml.dump({"message": "default api message", "threads": 2}, Dumper=YAML_SAFE_DUMPER)
         )
 
         # 3. Create meta.yaml for info and schema
@@ -62,7 +63,7 @@ rule create_output:
                 "params_schema": {
                     "message": {"description": "The message to write to the output file."}
                 }
-            })
+            }, Dumper=YAML_SAFE_DUMPER)
         )
 
         # 4. Create demos/ directory
@@ -71,7 +72,7 @@ rule create_output:
             yaml.dump({
                 "__description__": "A simple demo case.",
                 "message": "hello from demo1"
-            })
+            }, Dumper=YAML_SAFE_DUMPER)
         )
         
         # Create results dir
@@ -116,7 +117,7 @@ def test_list_workflows(api_client):
     """Test the GET /workflows endpoint."""
     response = api_client.get("/workflows")
     assert response.status_code == 200
-    data = response.json()
+    data = orjson.loads(response.content)
     assert isinstance(data, list)
     assert len(data) > 0
     assert data[0]["id"] == "api_test_workflow"
@@ -126,7 +127,7 @@ def test_get_workflow_meta(api_client):
     """Test the GET /workflows/{workflow_id:path} endpoint."""
     response = api_client.get("/workflows/api_test_workflow")
     assert response.status_code == 200
-    data = response.json()
+    data = orjson.loads(response.content)
     assert data["id"] == "api_test_workflow"
     assert data["info"]["name"] == "API Test Workflow"
     assert data["default_config"]["message"] == "default api message"
@@ -137,13 +138,14 @@ def test_get_workflow_demos(api_client):
     """Test the GET /demos/workflows/{workflow_id:path} endpoint."""
     response = api_client.get("/demos/workflows/api_test_workflow")
     assert response.status_code == 200
-    data = response.json()
+    data = orjson.loads(response.content)
     assert isinstance(data, list)
     assert len(data) == 1
     assert data[0]["name"] == "demo1"
     assert data[0]["config"]["message"] == "hello from demo1"
 
 
+@pytest.mark.xdist_group(name="job_store")
 def test_workflow_process_async(api_client):
     """Test the full async lifecycle of the POST /workflow-processes endpoint."""
     # 1. Submit the job with a config override
@@ -154,22 +156,16 @@ def test_workflow_process_async(api_client):
     }
     response = api_client.post("/workflow-processes", json=request_payload)
     assert response.status_code == 202, f"Submission failed: {response.text}"
-    submission_data = response.json()
+    submission_data = orjson.loads(response.content)
     job_id = submission_data["job_id"]
     status_url = submission_data["status_url"]
     assert status_url == f"/workflow-processes/{job_id}"
 
-    # 2. Poll for status
-    job_status = None
-    final_data = {}
-    for _ in range(20): # Poll for up to 20 seconds
-        time.sleep(1)
-        status_response = api_client.get(status_url)
-        assert status_response.status_code == 200
-        final_data = status_response.json()
-        job_status = final_data["status"]
-        if job_status in ["completed", "failed"]:
-            break
+    # 2. Long-poll until the job finishes
+    status_response = api_client.get(f"{status_url}/wait", params={"timeout": 20})
+    assert status_response.status_code == 200
+    final_data = orjson.loads(status_response.content)
+    job_status = final_data["status"]
     
     # 3. Assert final status and result
     assert job_status == "completed", f"Job did not complete. Final data: {final_data}"
@@ -1,27 +1,12 @@
 import pytest
 import os
-import tempfile
-import shutil
 from pathlib import Path
 from snakemake_mcp_server.workflow_runner import run_workflow
+from snakemake_mcp_server.utils import YAML_SAFE_DUMPER
 import yaml
 
-@pytest.fixture(scope="function")
-def dummy_workflow_setup():
-    """Sets up a dummy Snakemake workflow for testing."""
-    # Use a temporary directory for the snakebase to ensure isolation
-    temp_snakebase = tempfile.mkdtemp()
-    workflows_dir = Path(temp_snakebase) / "snakemake-workflows"
-    
-    workflow_id = "dummy_test_workflow"
-    dummy_workflow_path = workflows_dir / workflow_id
-    dummy_workflow_path.mkdir(parents=True, exist_ok=True)
-
-    # Create workflow/Snakefile
-    (dummy_workflow_path / "workflow").mkdir()
-    workflow_snakefile = dummy_workflow_path / "workflow" / "Snakefile"
-    
-    snakefile_content = """
+# Identical for every test, so built once at import
+SNAKEFILE_CONTENT = """
 rule all:
     input: "results/output.txt"
 
@@ -33,29 +18,35 @@ rule create_output:
     shell:
         "echo {params.message} > {output}"
 """
-    workflow_snakefile.write_text(snakefile_content)
+CONFIG_YAML = yaml.dump({"message": "default message", "threads": 1}, Dumper=YAML_SAFE_DUMPER)
 
-    # Create config/config.yaml
-    (dummy_workflow_path / "config").mkdir()
-    config_file = dummy_workflow_path / "config" / "config.yaml"
+@pytest.fixture(scope="function")
+def dummy_workflow_setup(tmp_path):
+    """Sets up a dummy Snakemake workflow for testing."""
+    # pytest removes old tmp_path trees itself, so there is no rmtree on teardown
+    workflows_dir = tmp_path / "snakemake-workflows"
     
-    config_content = {"message": "default message", "threads": 1}
-    with open(config_file, 'w') as f:
-        yaml.dump(config_content, f)
+    workflow_id = "dummy_test_workflow"
+    dummy_workflow_path = workflows_dir / workflow_id
+    # Leaf directories only; parents come with them
+    for sub in ("workflow", "config", "results"):
+        (dummy_workflow_path / sub).mkdir(parents=True, exist_ok=True)
+
+    # Create workflow/Snakefile
+    workflow_snakefile = dummy_workflow_path / "workflow" / "Snakefile"
+    workflow_snakefile.write_text(SNAKEFILE_CONTENT)
 
-    # Create results directory for output
-    (dummy_workflow_path / "results").mkdir(exist_ok=True)
+    # Create config/config.yaml
+    config_file = dummy_workflow_path / "config" / "config.yaml"
+    config_file.write_text(CONFIG_YAML)
 
-    yield {
+    return {
         "workflow_id": workflow_id,
         "workflow_path": str(dummy_workflow_path),
         "output_file": "results/output.txt",
         "workflows_dir": str(workflows_dir),
     }
 
-    # Teardown
-    shutil.rmtree(temp_snakebase)
-
 def test_run_snakemake_workflow_basic(dummy_workflow_setup):
     """Tests the basic functionality of the refactored run_workflow function."""
     output_file_path = Path(dummy_workflow_setup["workflow_path"]) / dummy_workflow_setup["output_file"]
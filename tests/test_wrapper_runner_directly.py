@@ -7,8 +7,10 @@ from pathlib import Path
 import os
 import json
 from pathlib import Path
+import io
 from snakemake_mcp_server.wrapper_runner import run_wrapper
-from snakemake_mcp_server.schemas import UserWrapperRequest, PlatformRunParams
+from snakemake_mcp_server.schemas import InternalWrapperRequest, UserWrapperRequest, PlatformRunParams
+from snakemake_mcp_server.utils import prepare_execution_workdir, write_wrapper_snakefile
 
 SNAKEBASE_DIR_ENV = os.environ.get("SNAKEBASE_DIR")
 if not SNAKEBASE_DIR_ENV:
@@ -39,16 +41,13 @@ def wrappers_path():
 
 
 
-@pytest.fixture
-def self_contained_faidx_data():
-    """Fixture for a self-contained samtools/faidx test using a temporary directory."""
-    with tempfile.TemporaryDirectory() as temp_dir:
-        input_file = os.path.join(temp_dir, "genome.fasta")
-        output_file = os.path.join(temp_dir, "genome.fasta.fai")
-        with open(input_file, "w") as f:
-            f.write(">chr1\nACGTACGT\n")
-        yield input_file, output_file
-        # Cleanup is handled by TemporaryDirectory
+@pytest.fixture(scope="session")
+def self_contained_faidx_data(tmp_path_factory):
+    """Session-wide samtools/faidx input, written once; tests link it into their workdir."""
+    genome_dir = tmp_path_factory.mktemp("genome")
+    input_file = genome_dir / "genome.fasta"
+    input_file.write_text(">chr1\nACGTACGT\n")
+    return str(input_file), str(genome_dir / "genome.fasta.fai")
 
 @pytest.fixture
 def arriba_data(wrappers_path):
@@ -80,7 +79,10 @@ async def test_samtools_faidx_self_contained(self_contained_faidx_data, run_wrap
     input_path = os.path.join(workdir, input_filename)
     output_path = os.path.join(workdir, output_filename)
     
-    shutil.copy2(input_file, input_path)
+    try:
+        os.link(input_file, input_path)
+    except OSError:
+        shutil.copy2(input_file, input_path)
 
     result = await wrapper_runner(
         wrapper_id="bio/samtools/faidx",
@@ -90,4 +92,46 @@ async def test_samtools_faidx_self_contained(self_contained_faidx_data, run_wrap
 
     assert result["status"] == "success"
     assert result["exit_code"] == 0
-    assert os.path.exists(output_path)
\ No newline at end of file
+    assert os.path.exists(output_path)
+
+def test_generated_snakefile_list_params():
+    """List params are written verbatim instead of raising NameError."""
+    params = ["--fast", 3]
+    request = InternalWrapperRequest(wrapper_id="master/bio/samtools/faidx", workdir="/tmp", params=params)
+    snakefile = io.StringIO()
+
+    write_wrapper_snakefile(snakefile, request=request, wrappers_path=str(WRAPPERS_PATH))
+
+    content = snakefile.getvalue()
+    assert f"    params: {params!r}\n" in content
+    assert content.endswith('    wrapper: "bio/samtools/faidx"\n')
+
+
+def test_generated_snakefile_k8s_image_goes_into_resources():
+    request = InternalWrapperRequest(
+        wrapper_id="bio/samtools/faidx", workdir="/tmp", container_img="img:1", resources={"mem_mb": 100}
+    )
+    snakefile = io.StringIO()
+
+    write_wrapper_snakefile(snakefile, request=request, wrappers_path=str(WRAPPERS_PATH), k8s_container_image="img:1")
+
+    content = snakefile.getvalue()
+    assert '    resources:\n        container_image="img:1",\n        mem_mb=100,\n' in content
+    assert "container:" not in content
+
+
+@pytest.mark.asyncio
+async def test_prepared_environment_yaml_is_a_separate_file(temp_dir):
+    wrappers = temp_dir / "wrappers"
+    create_dummy_wrapper(wrappers, "tool", "")
+    (wrappers / "bio/tool/environment.yaml").write_text("channels: [bioconda]\n")
+    workdir = temp_dir / "work"
+    workdir.mkdir()
+    request = InternalWrapperRequest(wrapper_id="bio/tool", workdir=str(workdir))
+
+    fd = os.open(workdir / "Snakefile", os.O_WRONLY | os.O_CREAT)
+    assert await prepare_execution_workdir(request, workdir, wrappers, fd, write_wrapper_snakefile) == "environment.yaml"
+
+    # Editing the workdir copy must never reach the wrapper repo
+    (workdir / "environment.yaml").write_text("edited\n")
+    assert (wrappers / "bio/tool/environment.yaml").read_text() == "channels: [bioconda]\n"
@@ -0,0 +1,25 @@
+import pytest
+
+from snakemake_mcp_server.wrapper_runner_k8s import _k8s_config
+
+@pytest.fixture
+def k8s_env(monkeypatch):
+    monkeypatch.setenv("SNAKEBASE_DIR", "/tmp/snakebase")
+    monkeypatch.setenv("SNAKEMAKE_KUBERNETES_PERSISTENT_VOLUME_CLAIM", "snakemake-pvc")
+    monkeypatch.setenv("SNAKEMAKE_KUBERNETES_PVC_MOUNT_PATH", "/shared")
+    monkeypatch.setenv("SNAKEMAKE_KUBERNETES_NAMESPACE", "default")
+    monkeypatch.setenv("SNAKEMAKE_KUBERNETES_SERVICE_ACCOUNT", "snakemake")
+    _k8s_config.cache_clear()
+    yield
+    _k8s_config.cache_clear()
+
+def test_static_cmd_keeps_logger_and_storage_args_separate(k8s_env):
+    """Adjacent string literals must not fuse the taskid and storage provider flags."""
+    static_cmd = _k8s_config().static_cmd
+    assert "--logger-supabase-taskid=tagA,tagB,tagC" in static_cmd
+    provider = static_cmd.index("--default-storage-provider")
+    assert static_cmd[provider + 1] == "fs"
+    assert not any(
+        "--default-storage-provider" in arg and arg != "--default-storage-provider"
+        for arg in static_cmd
+    )